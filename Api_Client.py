@@ -0,0 +1,361 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from Circuit_Breaker import BREAKERS
+from Concurrency_Limiter import AdaptiveLimiter
+from Deadlines import DeadlineExceeded, as_timeouts
+from Field_Mapping import loads
+from Hedging import HEDGING
+from Request_Coalescer import AsyncRequestCoalescer, NullCoalescer, RequestCoalescer
+from Response_Cache import CacheMissError
+from Retry_Policy import RetryPolicy
+from Run_Log import get_logger
+from Run_Metrics import METRICS
+
+log = get_logger("client")
+
+# EXTRACTOR_BASE_URL points every client at another extractor, e.g. the benchmark stand-in server
+BASE_URL = os.environ.get("EXTRACTOR_BASE_URL", "http://localhost:5000")
+
+# Extractor service endpoints used by the PDP, Search and Reviews scripts
+ENDPOINTS = {
+    "apiextraction": "/api/apiextraction",
+    "extraction": "/api/extraction/sku",
+    "search": "/api/search",
+    "review": "/api/review",
+}
+
+# Build the request URL for an endpoint, keeping the query string exactly as the scripts send it
+def build_url(endpoint, base_url=BASE_URL, **params):
+    query = "&".join(f"{key}={value}" for key, value in params.items())
+    return f"{base_url}{ENDPOINTS[endpoint]}?{query}"
+
+# request() passes a callable giving the (connect, read) timeouts of an attempt, worked out as late as
+# possible so time spent queueing for the breaker or limiter comes off the deadline
+def attempt_timeout(timeout):
+    return timeout() if callable(timeout) else timeout
+
+# Whether the deadline behind a callable timeout has passed, i.e. an attempt that timed out was cut
+# short by it rather than by a slow backend
+def deadline_passed(timeout):
+    try:
+        attempt_timeout(timeout)
+    except DeadlineExceeded:
+        return True
+    return False
+
+# Shared keep-alive HTTP client with a connection pool sized to the number of workers.
+# With adaptive=True, `workers` is only the ceiling: an AIMD limiter per (endpoint, rootdomain)
+# decides how many of those requests are actually in flight. An optional ResponseCache answers
+# repeated requests locally, and with coalesce=True duplicate requests in flight together share one
+# backend call; coalesce_results > 0 also keeps that many recent 200 results for later duplicates.
+# Every HTTP attempt is recorded in `metrics` (the process-wide Run_Metrics.METRICS by default). Each
+# request goes through the circuit breaker for its (endpoint, rootdomain) from `breakers`
+# (Circuit_Breaker.BREAKERS), which sees one outcome per request once its retries are done.
+# When `hedging` (Hedging.HEDGING) is enabled, attempts that are slow for their (endpoint, rootdomain)
+# are sent a second time; both copies run on a separate thread pool and the connection pool is doubled
+# to leave room for them.
+class ApiClient:
+    def __init__(self, workers=100, base_url=BASE_URL, retry_policy=None, adaptive=True, cache=None, coalesce=True, metrics=None,
+                 breakers=None, hedging=None, coalesce_results=0):
+        self.workers = workers
+        self.metrics = metrics or METRICS
+        self.breakers = breakers or BREAKERS
+        self.hedging = hedging or HEDGING
+        self.hedge_pool = None
+        self.base_url = base_url
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.adaptive = adaptive
+        self.cache = cache
+        self.coalescer = RequestCoalescer(coalesce_results, retained) if coalesce else NullCoalescer()
+        self.limiters = {}
+        self._limiters_lock = threading.Lock()
+        self.session = requests.Session()
+        pool_size = workers * 2 if self.hedging.enabled else workers
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, endpoint, **params):
+        return build_url(endpoint, base_url=self.base_url, **params)
+
+    def limiter(self, endpoint, rootdomain):
+        if not self.adaptive:
+            return None
+        key = (endpoint, rootdomain)
+        with self._limiters_lock:
+            if key not in self.limiters:
+                self.limiters[key] = AdaptiveLimiter(max_limit=self.workers)
+            return self.limiters[key]
+
+    def get(self, endpoint, timeout, **params):
+        return cached_get(self.cache, endpoint, params, lambda: self._hedged_send(endpoint, timeout, params), self.url)
+
+    def _hedged_send(self, endpoint, timeout, params):
+        if not self.hedging.enabled:
+            return self._send(endpoint, timeout, params)
+        with self._limiters_lock:
+            if self.hedge_pool is None:
+                self.hedge_pool = ThreadPoolExecutor(max_workers=self.workers * 2, thread_name_prefix="hedge")
+        return self.hedging.call(endpoint, params.get("rootdomain"), lambda sent: self._send(endpoint, timeout, params, sent),
+                                   self.hedge_pool)
+
+    # sent() is called (for hedging) once the attempt has cleared the limiter
+    def _send(self, endpoint, timeout, params, sent=None):
+        rootdomain = params.get("rootdomain")
+        attempt_timeout(timeout)  # Fail before queueing when the deadline has already passed
+        limiter = self.limiter(endpoint, rootdomain)
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            connect_read = attempt_timeout(timeout)
+        except DeadlineExceeded:
+            if limiter is not None:
+                limiter.cancel()
+            raise
+        if sent is not None:
+            sent()
+        start = self.metrics.started(endpoint, rootdomain)
+        response = error = None
+        try:
+            response = self.session.get(self.url(endpoint, **params), timeout=connect_read)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            latency = self.metrics.finished(endpoint, rootdomain, start, response, error)
+            if limiter is not None:
+                if isinstance(error, requests.Timeout) and deadline_passed(timeout):
+                    limiter.cancel()  # Cut short by the deadline: says nothing about the backend's capacity
+                else:
+                    limiter.release(latency, response is not None and response.status_code == 200)
+
+    # GET with the client's retry policy; returns (response, attempts). Identical requests in flight or
+    # already answered with a 200 share that result unless coalesce=False asks for a fresh call.
+    # timeout is a Deadlines.Timeouts, a (connect, read) pair or one number for both; the request and
+    # its retries stop at its total deadline or the run deadline with Deadlines.DeadlineExceeded.
+    def request(self, endpoint, timeout, max_attempts=None, coalesce=True, **params):
+        timeouts = as_timeouts(timeout)
+        def send():
+            deadline = timeouts.deadline()
+            breaker = self.breakers.get(endpoint, params.get("rootdomain"))
+            timeouts.attempt(deadline)  # Fail before queueing when the deadline has already passed
+            breaker.wait(self.breakers.park_seconds, deadline)
+            attempts = [0]
+            def attempt():
+                attempts[0] += 1
+                return self.get(endpoint, lambda: timeouts.attempt(deadline), **params)
+            result = error = None
+            try:
+                result = self.retry_policy.call(attempt, max_attempts, deadline)
+                return result
+            except requests.Timeout as e:
+                error = e
+                # The last attempt was cut short by the deadline rather than timing out on its own
+                if deadline.expired():
+                    error = deadline.exceeded()
+                    raise error from e
+                raise
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self.metrics.retried(endpoint, params.get("rootdomain"), attempts[0] - 1)
+                if isinstance(error, DeadlineExceeded):
+                    breaker.abandon()  # Cut short by its deadline: no verdict on the backend
+                else:
+                    breaker.record_request(result and result[0], error)
+        if not coalesce:
+            return send()
+        return self.coalescer.call(endpoint, params, send)
+
+    # Forget results and metrics from an earlier run in this process
+    def new_run(self):
+        self.coalescer.clear()
+        self.metrics.reset()
+        self.breakers.clear()
+        self.hedging.clear()
+
+    def log_concurrency(self):
+        for (endpoint, rootdomain), limiter in self.limiters.items():
+            log.info(f"Adaptive concurrency for {endpoint} {rootdomain}: {limiter.summary()}")
+        for line in self.breakers.summary_lines() + self.hedging.summary_lines():
+            log.info(line)
+
+    def close(self):
+        if self.hedge_pool is not None:
+            self.hedge_pool.shutdown(wait=False)
+        self.session.close()
+
+# Serve a request from the cache when possible, otherwise send it and store a 200 response
+def cached_get(cache, endpoint, params, send, url):
+    if cache is None:
+        return send()
+    cached = cache.get(endpoint, params)
+    if cached is not None:
+        return BufferedResponse(*cached)
+    if cache.cache_only:
+        raise CacheMissError(f"No cached response for {url(endpoint, **params)}")
+    response = send()
+    if response.status_code == 200:
+        cache.put(endpoint, params, response.status_code, response.content, response.headers)
+    return response
+
+async def cached_get_async(cache, endpoint, params, send, url):
+    if cache is None:
+        return await send()
+    cached = cache.get(endpoint, params)
+    if cached is not None:
+        return BufferedResponse(*cached)
+    if cache.cache_only:
+        raise CacheMissError(f"No cached response for {url(endpoint, **params)}")
+    response = await send()
+    if response.status_code == 200:
+        cache.put(endpoint, params, response.status_code, response.content, response.headers)
+    return response
+
+# Minimal requests.Response look-alike for asyncio and cached responses
+class BufferedResponse:
+    def __init__(self, status_code, content, headers):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return loads(self.content)
+
+# What the coalescer keeps of a (response, attempts) result: the status and body, not the whole
+# requests.Response with its connection and raw objects
+def retained(result):
+    response, attempts = result
+    return BufferedResponse(response.status_code, response.content, {}), attempts
+
+# Asyncio counterpart of ApiClient; in-flight requests are bounded by a semaphore instead of threads
+class AsyncApiClient:
+    def __init__(self, concurrency=1000, base_url=BASE_URL, retry_policy=None, cache=None, coalesce=True, metrics=None, breakers=None,
+                 hedging=None, coalesce_results=0):
+        self.concurrency = concurrency
+        self.metrics = metrics or METRICS
+        self.breakers = breakers or BREAKERS
+        self.hedging = hedging or HEDGING
+        self.base_url = base_url
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.cache = cache
+        self.coalescer = AsyncRequestCoalescer(coalesce_results, retained) if coalesce else NullCoalescer()
+        self.session = None
+
+    async def __aenter__(self):
+        import aiohttp  # Only needed for the asyncio engine
+        self._aiohttp = aiohttp
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    # Forget metrics, breaker and hedging state from an earlier run in this process; the coalescer
+    # belongs to this client and starts empty
+    def new_run(self):
+        self.metrics.reset()
+        self.breakers.clear()
+        self.hedging.clear()
+
+    def log_concurrency(self):
+        for line in self.breakers.summary_lines() + self.hedging.summary_lines():
+            log.info(line)
+
+    def url(self, endpoint, **params):
+        return build_url(endpoint, base_url=self.base_url, **params)
+
+    async def get(self, endpoint, timeout, **params):
+        return await cached_get_async(self.cache, endpoint, params, lambda: self._hedged_send(endpoint, timeout, params), self.url)
+
+    async def _hedged_send(self, endpoint, timeout, params):
+        if not self.hedging.enabled:
+            return await self._send(endpoint, timeout, params)
+        return await self.hedging.call_async(endpoint, params.get("rootdomain"), lambda sent: self._send(endpoint, timeout, params, sent))
+
+    # Errors are raised as requests exceptions so both engines share the same handling
+    async def _send(self, endpoint, timeout, params, sent=None):
+        url = self.url(endpoint, **params)
+        rootdomain = params.get("rootdomain")
+        attempt_timeout(timeout)  # Fail before queueing when the deadline has already passed
+        async with self.semaphore:
+            timeout = attempt_timeout(timeout)
+            connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            if sent is not None:
+                sent()
+            start = self.metrics.started(endpoint, rootdomain)
+            response = error = None
+            try:
+                client_timeout = self._aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+                async with self.session.get(url, timeout=client_timeout) as raw_response:
+                    response = BufferedResponse(raw_response.status, await raw_response.read(), raw_response.headers)
+                    return response
+            except asyncio.TimeoutError as e:
+                error = requests.Timeout(f"Request to {url} timed out")
+                raise error from e
+            except self._aiohttp.ClientError as e:
+                error = requests.ConnectionError(str(e))
+                raise error from e
+            finally:
+                self.metrics.finished(endpoint, rootdomain, start, response, error)
+
+    async def request(self, endpoint, timeout, max_attempts=None, coalesce=True, **params):
+        timeouts = as_timeouts(timeout)
+        async def send():
+            deadline = timeouts.deadline()
+            breaker = self.breakers.get(endpoint, params.get("rootdomain"))
+            timeouts.attempt(deadline)  # Fail before queueing when the deadline has already passed
+            await breaker.wait_async(self.breakers.park_seconds, deadline)
+            attempts = [0]
+            def attempt():
+                attempts[0] += 1
+                return self.get(endpoint, lambda: timeouts.attempt(deadline), **params)
+            result = error = None
+            try:
+                result = await self.retry_policy.call_async(attempt, max_attempts, deadline)
+                return result
+            except requests.Timeout as e:
+                error = e
+                # The last attempt was cut short by the deadline rather than timing out on its own
+                if deadline.expired():
+                    error = deadline.exceeded()
+                    raise error from e
+                raise
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self.metrics.retried(endpoint, params.get("rootdomain"), attempts[0] - 1)
+                if isinstance(error, DeadlineExceeded):
+                    breaker.abandon()  # Cut short by its deadline: no verdict on the backend
+                else:
+                    breaker.record_request(result and result[0], error)
+        if not coalesce:
+            return await send()
+        return await self.coalescer.call(endpoint, params, send)
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+# Return the process-wide client, growing its pool if a run needs more workers
+def get_client(workers=100, cache=None):
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None or _default_client.workers < workers:
+            if _default_client is not None:
+                _default_client.close()
+            _default_client = ApiClient(workers=workers, cache=cache)
+        elif cache is not None:
+            _default_client.cache = cache
+        return _default_client
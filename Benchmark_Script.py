@@ -0,0 +1,315 @@
+import datetime
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from openpyxl import Workbook, load_workbook
+import PDP_Script
+import Search_Script
+from Api_Client import ApiClient, build_url
+from Field_Mapping import RowSchema, loads, orjson
+from Mock_Server import search_payload, sku_payload, start_server
+from Output_Writer import highlight_fill, red_fill, stringify
+
+# Bare requests.get per call: a fresh TCP connection for every request
+def run_bare(base_url, rootdomain, skus, workers, timeout):
+    def fetch(sku):
+        return requests.get(build_url("extraction", base_url=base_url, rootdomain=rootdomain, sku=sku), timeout=timeout).status_code
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fetch, skus))
+
+# Shared pooled keep-alive client
+def run_pooled(base_url, rootdomain, skus, workers, timeout):
+    client = ApiClient(workers=workers, base_url=base_url, adaptive=False)
+    def fetch(sku):
+        return client.get("extraction", timeout, rootdomain=rootdomain, sku=sku).status_code
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(fetch, skus))
+    finally:
+        client.close()
+
+def measure(name, runner, base_url, rootdomain, skus, workers, timeout):
+    start = time.perf_counter()
+    statuses = runner(base_url, rootdomain, skus, workers, timeout)
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for status in statuses if status != 200)
+    print(f"{name:<8} {len(skus)} requests, {workers} workers: {elapsed:.2f}s, {len(skus) / elapsed:.0f} req/s, {failed} failed")
+    return elapsed
+
+# The pre-streaming PDP styling pass: every per-column rule re-ran inside the header loop,
+# so the work grew with columns x columns x rows
+def legacy_write_data_to_excel(output_file, data_list):
+    headers = PDP_Script.HEADERS
+    wb = Workbook()
+    ws = wb.active
+    for data in data_list:
+        ws.append([stringify(data.get(field, "")) for field in headers])
+    wb.save(output_file)
+    wb = load_workbook(output_file)
+    ws = wb.active
+    for col_idx, header in enumerate(headers, start=1):
+        column_values = [ws.cell(row=row_idx, column=col_idx).value for row_idx in range(2, ws.max_row + 1)]
+        non_empty_values = [val for val in column_values if val not in [None, "", False,"False",0,"0","Unknown","unknown"]]
+        if len(set(non_empty_values)) == 1 and len(non_empty_values) > 0:
+            ws.cell(row=1, column=col_idx).fill = red_fill
+    for col_idx, header in enumerate(headers, start=1):
+        for row_idx in range(2, ws.max_row + 1):
+            cell = ws.cell(row=row_idx, column=col_idx)
+            if cell.value in [None, ""]:
+                cell.fill = highlight_fill
+        for rule_header, rule in [("product_Image_match", lambda v: v == True), ("Images_starts_with_http", lambda v: v == False),
+                                  ("availability", lambda v: v not in [1, "1"]), ("condition", lambda v: v not in [1, "1"]),
+                                  ("attributes", lambda v: isinstance(v, str) and isinstance(eval(v), dict) and any(x in [None, ""] for x in eval(v).values()))]:
+            for row_idx in range(2, ws.max_row + 1):
+                cell = ws.cell(row=row_idx, column=headers.index(rule_header) + 1)
+                if rule(cell.value):
+                    cell.fill = highlight_fill
+        for row_idx in range(2, ws.max_row + 1):
+            for img_col in PDP_Script.IMAGE_COLUMNS:
+                cell = ws.cell(row=row_idx, column=headers.index(img_col) + 1)
+                if cell.value and not str(cell.value).startswith("http"):
+                    cell.fill = highlight_fill
+    wb.save(output_file)
+
+def synthetic_pdp_rows(count, rootdomain="hp.com/us"):
+    rows = []
+    for index in range(count):
+        payload = sku_payload(rootdomain, f"sku-{index}")
+        if index % 7 == 0:
+            payload["skuEntry"]["attributes"]["color"] = ""
+            payload["skuEntry"]["availability"] = 0
+        rows.append(PDP_Script.parse_seller_sku(payload, 200))
+    return rows
+
+# Time the PDP highlighting/write phase; the legacy pass is only run up to legacy_max_rows
+def benchmark_highlighting(row_counts, legacy_max_rows=10000):
+    with tempfile.TemporaryDirectory() as directory:
+        for count in row_counts:
+            rows = synthetic_pdp_rows(count)
+            output_file = os.path.join(directory, f"pdp_{count}.xlsx")
+            start = time.perf_counter()
+            PDP_Script.write_data_to_excel(output_file, rows)
+            streaming = time.perf_counter() - start
+            print(f"highlight {count} rows: streaming single pass {streaming:.2f}s")
+            if count <= legacy_max_rows:
+                start = time.perf_counter()
+                legacy_write_data_to_excel(output_file, rows)
+                legacy = time.perf_counter() - start
+                print(f"highlight {count} rows: legacy per-header passes {legacy:.2f}s ({legacy / streaming:.1f}x slower)")
+            else:
+                print(f"highlight {count} rows: legacy pass skipped (above {legacy_max_rows} rows)")
+
+# The hand-written PDP row builder that PDP_SCHEMA replaced
+def legacy_parse_seller_sku(sellerSku, status_code):
+    skuEntry = sellerSku.get("skuEntry", {})
+    skuImages = skuEntry.get("skuImages", {})
+    shipping_options = skuEntry.get("shippingOptions", [])
+
+    image_urls = [
+        skuImages.get(f'productImageUrl{i}') for i in range(1, 11)
+    ]
+
+    # Check if all image URLs start with "http" or "https"
+    images_start_with_http = all(url is None or str(url).startswith("http") for url in image_urls)
+
+    return {
+        "status_code": status_code,
+        "price_skuSeller": sellerSku.get("price"),  # Price from skuSeller
+        "price_skuEntry": skuEntry.get("price"),  # Price from skuEntry
+        "price": sellerSku.get("price") or skuEntry.get("price"),
+        "condition": sellerSku.get("condition"),
+        "source": sellerSku.get("source"),
+        "sku": skuEntry.get("sku"),
+        "url": skuEntry.get("url"),
+        "name": skuEntry.get("name"),
+        "brand": skuEntry.get("brand"),
+        "description": skuEntry.get("description"),
+        "features": skuEntry.get("features"),
+        "upc": skuEntry.get("upc"),
+        "ean": skuEntry.get("ean"),
+        "mpn": skuEntry.get("mpn"),
+        "item_number": skuEntry.get("itemNumber"),
+        "store_sku": skuEntry.get("storeSku"),
+        "store_name": skuEntry.get("storeName"),
+        "availability": skuEntry.get("availability"),
+        "category": skuEntry.get("category"),
+        "attributes": skuEntry.get("attributes"),
+        "star_rating_distribution": skuEntry.get("starRatingDistribution"),
+        "average_customer_review": skuEntry.get("averageCustomerReview"),
+        "number_of_customer_reviews": skuEntry.get("numberOfCustomerReviews"),
+        "variants": skuEntry.get("variants"),
+        "parent_sku": skuEntry.get("parentSku"),
+        "seller_name": skuEntry.get("sellerName"),
+        "seller_id": sellerSku.get("skuEntry", {}).get("buyBoxWinnerHistory"),
+        "quantity_sold": skuEntry.get("quantitySold"),
+        "quantity_sold_7d": skuEntry.get("quantitySold7D"),
+        "variant_attributes": skuEntry.get("variantAttributes"),
+        "number_of_favorites": skuEntry.get("numberOfFavorites"),
+        "deal_type": skuEntry.get("dealType"),
+        "deal_text": skuEntry.get("dealText"),
+        "promo_text": skuEntry.get("promoText"),
+        "list_price": skuEntry.get("listPrice"),
+        "numberOfPayments" : skuEntry.get('numberOfPayments'),
+        "pricePerPayments": skuEntry.get('pricePerPayments'),
+        'totalPaymentsPrice': skuEntry.get('totalPaymentsPrice'),
+        "productImageUrl1": skuImages.get('productImageUrl1'),
+        "productImageUrl2": skuImages.get('productImageUrl2'),
+        "productImageUrl3": skuImages.get('productImageUrl3'),
+        "productImageUrl4": skuImages.get('productImageUrl4'),
+        "productImageUrl5": skuImages.get('productImageUrl5'),
+        "productImageUrl6": skuImages.get('productImageUrl6'),
+        "productImageUrl7": skuImages.get('productImageUrl7'),
+        "productImageUrl8": skuImages.get('productImageUrl8'),
+        "productImageUrl9": skuImages.get('productImageUrl9'),
+        "productImageUrl10": skuImages.get('productImageUrl10'),
+        "Images_starts_with_http": images_start_with_http,
+        "product_Image_match": skuImages.get('productImageUrl1') == skuImages.get('productImageUrl2') == skuImages.get('productImageUrl3') ==skuImages.get('productImageUrl4') == skuImages.get('productImageUrl5') == skuImages.get('productImageUrl6') == skuImages.get('productImageUrl7') == skuImages.get('productImageUrl8') == skuImages.get('productImageUrl9') == skuImages.get('productImageUrl10'),
+        "used_price": skuEntry.get("usedPrice"),
+        "model": skuEntry.get("model"),
+        "image_count": skuEntry.get("imageCount"),
+        "video_count": skuEntry.get("videoCount"),
+        "document_count": skuEntry.get("documentCount"),
+        "isSponsored": skuEntry.get("isSponsored"),
+        "coupon_absolute_discount": skuEntry.get("couponAbsoluteDiscount"),
+        "coupon_percent_discount": skuEntry.get("couponPercentDiscount"),
+        "panorama_count": skuEntry.get("panoramaCount"),
+        "is_aplus": skuEntry.get("isAPlus"),
+        "aplus_premium": skuEntry.get("aplusPremium"),
+        "aplus_comparison": skuEntry.get("aplusComparison"),
+        "aplus_faq": skuEntry.get("aplusFaq"),
+        "aplus_video": skuEntry.get("aplusVideo"),
+        "flash_sale_end_time": skuEntry.get("flashSaleEndTime"),
+        "is_official_seller": skuEntry.get("isOfficialSeller"),
+        "price_by_unit": skuEntry.get("priceByUnit"),
+        "price_per_unit": skuEntry.get("pricePerUnit"),
+        "currency": skuEntry.get("currency"),
+        "uvp": skuEntry.get("uvp"),
+        "shipping_options": shipping_options,
+        "process_name": "cds",
+        "timestamp": datetime.datetime.now().isoformat(),
+        "rootdomain": skuEntry.get("rootDomain"),
+        "preorder": "",
+        "category_l1": skuEntry.get("categoryLvl1"),
+        "category_l2": skuEntry.get("categoryLvl2"),
+        "category_l3": skuEntry.get("categoryLvl3"),
+        "category_l4": skuEntry.get("categoryLvl4"),
+        "category_l5": skuEntry.get("categoryLvl5"),
+        "category_l6": skuEntry.get("categoryLvl6"),
+        "category_l7": skuEntry.get("categoryLvl7"),
+        "category_l8": skuEntry.get("categoryLvl8"),
+        "category_l9": skuEntry.get("categoryLvl9"),
+        "category_l10": skuEntry.get("categoryLvl10"),
+        "normalized_attributes": "",
+        "title_attributes": "",
+        "tagged_name": "",
+        "number_of_customer_ratings": skuEntry.get("numberOfCustomerRatings"),
+        "redirected_sku": skuEntry.get("redirectedSku"),
+    }
+
+# Recorded extractor bodies: PDP batches of 20 sellerSkus and full search pages
+def recorded_responses(count, rootdomain="hp.com/us"):
+    pdp = [json.dumps({"sellerSkus": [sku_payload(rootdomain, f"sku-{index}-{item}") for item in range(20)]}).encode() for index in range(count)]
+    search = [json.dumps(search_payload(rootdomain, f"term{index}", 1)).encode() for index in range(count)]
+    return pdp, search
+
+# Per-response CPU of decoding and row building: json + hand-written dicts against the fast decoder +
+# compiled schemas
+def benchmark_parsing(count):
+    pdp_bodies, search_bodies = recorded_responses(count)
+    rows = count * 20
+    timings = {}
+    for name, decode in [("json", json.loads), ("fast", loads)]:
+        start = time.perf_counter()
+        for body in pdp_bodies:
+            decode(body)
+        timings[name] = time.perf_counter() - start
+    print(f"decode {len(pdp_bodies)} PDP batches: json {timings['json']:.2f}s, {'orjson' if orjson else 'json (orjson missing)'} {timings['fast']:.2f}s")
+
+    decoded = [loads(body)["sellerSkus"] for body in pdp_bodies]
+    for name, build in [("legacy", legacy_parse_seller_sku), ("schema", PDP_Script.parse_seller_sku)]:
+        start = time.perf_counter()
+        for sellerSkus in decoded:
+            for sellerSku in sellerSkus:
+                build(sellerSku, 200)
+        timings[name] = time.perf_counter() - start
+    print(f"build {rows} PDP rows: hand-written {timings['legacy']:.2f}s, compiled schema {timings['schema']:.2f}s")
+
+    for name, decode, build in [("before", json.loads, legacy_parse_seller_sku), ("after", loads, PDP_Script.parse_seller_sku)]:
+        start = time.perf_counter()
+        for body in pdp_bodies:
+            for sellerSku in decode(body)["sellerSkus"]:
+                build(sellerSku, 200)
+        timings[name] = time.perf_counter() - start
+    print(f"PDP end to end: {timings['before'] * 1e6 / rows:.1f}us/row before, {timings['after'] * 1e6 / rows:.1f}us/row after "
+          f"({timings['before'] / timings['after']:.2f}x)")
+
+    start = time.perf_counter()
+    for body in search_bodies:
+        for index, item in enumerate(loads(body)["searchItems"], start=1):
+            Search_Script.SEARCH_SCHEMA.build(item, statuscode=200, search_term="term", page=1, rank=index)
+    print(f"search: {len(search_bodies)} pages decoded and built in {time.perf_counter() - start:.2f}s")
+
+# Runs in a fresh process: peak RSS growth while holding `count` PDP rows, each built from its own decoded
+# body as in a real run. "dict" rows come from the schema without compact records or interning.
+def hold_pdp_rows(count, representation, results):
+    import resource
+    schema = PDP_Script.PDP_SCHEMA if representation == "compact" else RowSchema(PDP_Script.PDP_SCHEMA.fields)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rows = [schema.build(loads(json.dumps(sku_payload("hp.com/us", f"sku-{index}")).encode()), status_code=200) for index in range(count)]
+    results.put((len(rows), (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) / 1024))
+
+# Peak memory of retained PDP rows, dicts against compact records; dict rows are only held up to
+# dict_max_rows and extrapolated linearly above that
+def benchmark_row_memory(row_counts, dict_max_rows=100000):
+    context = multiprocessing.get_context("spawn")
+    per_row = None
+    for count in row_counts:
+        peaks = {}
+        for representation in ["dict", "compact"]:
+            if representation == "dict" and count > dict_max_rows:
+                continue
+            results = context.Queue()
+            process = context.Process(target=hold_pdp_rows, args=(count, representation, results))
+            process.start()
+            peaks[representation] = results.get()[1]
+            process.join()
+        if "dict" in peaks:
+            dict_text = f"{peaks['dict']:.0f}MB"
+            per_row = peaks["dict"] / count
+        elif per_row is not None:
+            dict_text = f"~{per_row * count:.0f}MB (extrapolated)"
+        else:
+            dict_text = "skipped"
+        print(f"hold {count} PDP rows: dict {dict_text}, compact {peaks['compact']:.0f}MB "
+              f"({peaks['compact'] * 1024 * 1024 / count:.0f} bytes/row)")
+
+def benchmark_client(requests_count, workers, timeout):
+    server = start_server()
+    base_url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    rootdomain = "hp.com/us"
+    skus = [f"SKU-{index}" for index in range(requests_count)]
+    try:
+        bare = measure("bare", run_bare, base_url, rootdomain, skus, workers, timeout)
+        pooled = measure("pooled", run_pooled, base_url, rootdomain, skus, workers, timeout)
+        print(f"Speedup: {bare / pooled:.2f}x")
+    finally:
+        server.shutdown()
+
+def main(requests_count, workers, timeout, highlight_rows, parse_responses, memory_rows):
+    benchmark_client(requests_count, workers, timeout)
+    benchmark_parsing(parse_responses)
+    benchmark_highlighting(highlight_rows)
+    benchmark_row_memory(memory_rows)
+
+if __name__ == "__main__":
+    requests_count = 5000
+    workers = 100
+    timeout = 30
+    highlight_rows = [10000, 100000]
+    parse_responses = 2000  # Recorded PDP batches (20 rows each) and search pages
+    memory_rows = [100000, 1000000]
+    main(requests_count, workers, timeout, highlight_rows, parse_responses, memory_rows)
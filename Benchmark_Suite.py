@@ -0,0 +1,254 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from openpyxl import Workbook
+from Hedging import HEDGING, add_hedging_arguments, percentile
+from Mock_Server import MockConfig, start_server
+from Output_Writer import OUTPUT_FORMATS
+
+try:
+    import resource  # Peak RSS; not available on Windows
+except ImportError:
+    resource = None
+
+# Scenario sizes are SKUs for pdp/reviews and search terms for search/pipeline
+SCRIPTS = ["pdp", "pdp-batch", "pdp-async", "search", "reviews", "pipeline"]
+ROOTDOMAIN = "hp.com/us"
+TIMEOUT = 30
+MAX_PAGES = 4
+
+# Times every call into a script's output writer, i.e. the write phase of the run
+class TimedWriter:
+    def __init__(self, writer):
+        self.writer = writer
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.writer, name)
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            with self._lock:
+                self.seconds += time.perf_counter() - start
+
+    def append(self, row):
+        return self._timed(self.writer.append, row)
+
+    def extend(self, rows):
+        return self._timed(self.writer.extend, rows)
+
+    def close(self):
+        return self._timed(self.writer.close)
+
+# Latency of every attempt the API clients make, seen from the caller: a hedged attempt and its
+# duplicate count once, as the first response. Nothing is changed on the client's path, so runs with
+# and without hedging are timed the same way.
+class RequestTimer:
+    def __init__(self):
+        self.latencies = []
+        self._lock = threading.Lock()
+
+    def add(self, start):
+        latency = time.perf_counter() - start
+        with self._lock:
+            self.latencies.append(latency)
+
+    def p99_ms(self):
+        with self._lock:
+            return percentile(sorted(self.latencies), 0.99) * 1000
+
+# Wrap the clients' get so every attempt is timed
+def time_requests():
+    import Api_Client
+    timer = RequestTimer()
+
+    def get(self, *args, _get=Api_Client.ApiClient.get, **kwargs):
+        start = time.perf_counter()
+        try:
+            return _get(self, *args, **kwargs)
+        finally:
+            timer.add(start)
+
+    async def get_async(self, *args, _get=Api_Client.AsyncApiClient.get, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await _get(self, *args, **kwargs)
+        finally:
+            timer.add(start)
+    Api_Client.ApiClient.get = get
+    Api_Client.AsyncApiClient.get = get_async
+    return timer
+
+# Wrap each script's open_output so the writers it opens are timed
+def time_writers(modules):
+    writers = []
+    for module in modules:
+        def open_output(*args, _open=module.open_output, **kwargs):
+            writer = TimedWriter(_open(*args, **kwargs))
+            writers.append(writer)
+            return writer
+        module.open_output = open_output
+    return writers
+
+def skus(size):
+    return [f"BENCH-SKU-{index}" for index in range(size)]
+
+def terms(size):
+    return [f"term{index}" for index in range(size)]
+
+def run_pdp(size, workers, output_format, engine="thread", batch_size=1):
+    import PDP_Script
+    writers = time_writers([PDP_Script])
+    workbook = Workbook()
+    workbook.active.append(["sku"])
+    for sku in skus(size):
+        workbook.active.append([sku])
+    workbook.save("input.xlsx")
+    PDP_Script.main(TIMEOUT, True, ROOTDOMAIN, workers, "input.xlsx", "pdp.xlsx", engine, batch_size, output_format=output_format)
+    return writers
+
+def run_search(size, workers, output_format):
+    import Search_Script
+    writers = time_writers([Search_Script])
+    Search_Script.main(workers, ROOTDOMAIN, terms(size), MAX_PAGES, TIMEOUT, output_format=output_format)
+    return writers
+
+def run_reviews(size, workers, output_format):
+    import Reviews_Script
+    writers = time_writers([Reviews_Script])
+    Reviews_Script.main(output_format=output_format, skus=skus(size), workers=workers)
+    return writers
+
+def run_pipeline(size, workers, output_format):
+    import PDP_Script
+    import Pipeline_Script
+    import Reviews_Script
+    import Search_Script
+    writers = time_writers([Search_Script, PDP_Script, Reviews_Script])
+    Pipeline_Script.main(workers, ROOTDOMAIN, terms(size), MAX_PAGES, TIMEOUT, output_format=output_format)
+    return writers
+
+SCENARIOS = {
+    "pdp": run_pdp,
+    "pdp-batch": lambda size, workers, output_format: run_pdp(size, workers, output_format, batch_size=20),
+    "pdp-async": lambda size, workers, output_format: run_pdp(size, workers, output_format, engine="async"),
+    "search": run_search,
+    "reviews": run_reviews,
+    "pipeline": run_pipeline,
+}
+
+# Runs in a fresh process so peak RSS and imports belong to this scenario alone; the script's
+# own output goes to /dev/null and its files to a scratch directory. hedge=(quantile, max_ratio)
+# turns hedging on for the scenario.
+def run_scenario(script, size, workers, output_format, results, hedge=None):
+    from Run_Metrics import METRICS
+    if hedge:
+        HEDGING.configure(True, quantile=hedge[0], max_ratio=hedge[1])
+    timer = time_requests()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            writers = SCENARIOS[script](size, workers, output_format)
+        elapsed = time.perf_counter() - start
+    series = METRICS.snapshot()["series"]
+    requests_sent = sum(entry["requests"] for entry in series)
+    failed = sum(count for entry in series for status, count in entry["statuses"].items() if status != "200")
+    results.put({
+        "script": script,
+        "size": size,
+        "workers": workers,
+        "seconds": elapsed,
+        "requests": requests_sent,
+        "failed": failed,
+        "requests_per_second": requests_sent / elapsed if elapsed else 0.0,
+        "write_seconds": sum(writer.seconds for writer in writers),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None,
+        "hedges": sum(tracker.hedges for tracker in HEDGING.trackers.values()),
+        "p99_ms": timer.p99_ms(),
+    })
+
+def measure(script, size, workers, output_format, hedge=None):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=run_scenario, args=(script, size, workers, output_format, results, hedge))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        print(f"{script} size={size} workers={workers}: failed with exit code {process.exitcode}")
+        return None
+    return results.get()
+
+def format_result(result, baseline=None):
+    rss = f"{result['peak_rss_mb']:.0f}MB" if result["peak_rss_mb"] is not None else "n/a"
+    line = (f"{result['script']:<10} size={result['size']:<6} workers={result['workers']:<4} {result['seconds']:7.2f}s "
+            f"{result['requests_per_second']:8.1f} req/s ({result['requests']} requests, {result['failed']} failed) "
+            f"write {result['write_seconds']:.2f}s peak RSS {rss} p99 {result['p99_ms']:.0f}ms")
+    if result["hedges"]:
+        line += f" ({result['hedges']} hedges)"
+    if baseline:
+        line += f" | vs baseline: time {result['seconds'] / baseline['seconds'] - 1:+.0%}, req/s {result['requests_per_second'] / baseline['requests_per_second'] - 1:+.0%}"
+        if baseline.get("p99_ms"):
+            line += f", p99 {result['p99_ms'] / baseline['p99_ms'] - 1:+.0%}"
+    return line
+
+def result_key(result):
+    return (result["script"], result["size"], result["workers"])
+
+# hedge=(quantile, max_ratio) runs every scenario with hedged requests; compare against a --baseline
+# without them for the makespan (time) and p99 gain
+def main(scripts, sizes, workers_list, config, output_format="xlsx", output_path=None, baseline_path=None, hedge=None):
+    baseline = {}
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as baseline_file:
+            baseline = {result_key(result): result for result in json.load(baseline_file)["results"]}
+    server = start_server(config=config)
+    os.environ["EXTRACTOR_BASE_URL"] = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    print(f"Stand-in server: latency {config.latency}, error rate {config.error_rate:.1%}")
+    if hedge:
+        print(f"Hedging requests slower than the p{hedge[0] * 100:g} latency, at most {hedge[1]:.0%} of requests")
+    results = []
+    try:
+        for script in scripts:
+            for size in sizes:
+                for workers in workers_list:
+                    result = measure(script, size, workers, output_format, hedge)
+                    if result is not None:
+                        results.append(result)
+                        print(format_result(result, baseline.get(result_key(result))))
+    finally:
+        server.shutdown()
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as output_file:
+            json.dump({"latency": config.latency, "error_rate": config.error_rate, "format": output_format, "hedge": hedge, "results": results},
+                      output_file, indent=2)
+        print(f"Results saved to {output_path}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the scripts against a local stand-in extractor and compare runs")
+    parser.add_argument("--scripts", nargs="+", choices=SCRIPTS, default=["pdp", "search", "reviews", "pipeline"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 1000], help="SKUs (pdp, reviews) or search terms (search, pipeline)")
+    parser.add_argument("--workers", nargs="+", type=int, default=[10, 50, 100])
+    parser.add_argument("--latency", default="lognormal:0.02:0.5", help="fixed:S, uniform:LO:HI, exponential:MEAN or lognormal:MEDIAN:SIGMA (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    parser.add_argument("--search-results", type=int, help="results per search term (default depends on the term)")
+    parser.add_argument("--reviews-per-sku", type=int, help="reviews per SKU (default depends on the SKU)")
+    parser.add_argument("--recordings", help="directory of recorded response bodies served instead of synthetic ones")
+    parser.add_argument("--format", choices=["xlsx", *OUTPUT_FORMATS], default="xlsx", help="output format the scripts write")
+    parser.add_argument("--output", help="save results as JSON")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    add_hedging_arguments(parser)
+    args = parser.parse_args()
+    config = MockConfig(args.latency, args.error_rate, args.search_results, args.reviews_per_sku, args.recordings)
+    hedge = (args.hedge_quantile, args.hedge_max_ratio) if args.hedge else None
+    main(args.scripts, args.sizes, args.workers, config, args.format, args.output, args.baseline, hedge)
@@ -0,0 +1,180 @@
+import datetime
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+from Output_Writer import StreamingExcelWriter, open_output_writer
+from Run_Log import get_logger
+
+log = get_logger("changes")
+
+# Columns of the diff report: one row per changed field, one per new SKU and one per failed fetch
+DIFF_HEADERS = ["sku", "change", "field", "old_value", "new_value", "status_code", "error", "timestamp"]
+
+# Content hash over the tracked columns of a row
+def content_hash(values):
+    return hashlib.sha1(json.dumps(values, default=str, sort_keys=True).encode()).hexdigest()
+
+# SQLite snapshot of the last successful extraction of each (rootdomain, sku): a hash of the tracked
+# columns, their values (to say which fields changed) and when the SKU was last fetched and changed.
+# Updates are buffered and written in batches.
+class SkuSnapshot:
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS skus ("
+            " rootdomain TEXT, sku TEXT, hash TEXT, fields TEXT, status TEXT, fetched_at REAL, changed_at REAL,"
+            " PRIMARY KEY (rootdomain, sku))"
+        )
+
+    # {sku: (fetched_at, status)} for one rootdomain
+    def ages(self, rootdomain):
+        with self._lock:
+            rows = self._db.execute("SELECT sku, fetched_at, status FROM skus WHERE rootdomain=?", (rootdomain,)).fetchall()
+        return {sku: (fetched_at, status) for sku, fetched_at, status in rows}
+
+    # (hash, fields) of the last successful extraction, or None for a SKU never extracted
+    def get(self, rootdomain, sku):
+        with self._lock:
+            row = self._db.execute("SELECT hash, fields FROM skus WHERE rootdomain=? AND sku=? AND hash IS NOT NULL",
+                                   (rootdomain, sku)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def put(self, rootdomain, sku, digest, fields, changed):
+        now = time.time()
+        self._queue(("INSERT INTO skus VALUES (?, ?, ?, ?, '200', ?, ?) ON CONFLICT (rootdomain, sku) DO UPDATE SET"
+                     " hash=excluded.hash, fields=excluded.fields, status='200', fetched_at=excluded.fetched_at,"
+                     " changed_at=CASE WHEN ? THEN excluded.changed_at ELSE skus.changed_at END",
+                     (rootdomain, sku, digest, json.dumps(fields, default=str), now, now, changed)))
+
+    # A failed fetch keeps the last good content but is due again on the next run
+    def failed(self, rootdomain, sku, status):
+        self._queue(("INSERT INTO skus (rootdomain, sku, status, fetched_at) VALUES (?, ?, ?, ?)"
+                     " ON CONFLICT (rootdomain, sku) DO UPDATE SET status=excluded.status",
+                     (rootdomain, sku, str(status), time.time())))
+
+    def _queue(self, statement):
+        with self._lock:
+            self._pending.append(statement)
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        with self._db:
+            for sql, params in self._pending:
+                self._db.execute(sql, params)
+        self._pending = []
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._db.close()
+
+# Which SKUs an incremental run fetches: new SKUs, SKUs whose last fetch failed, SKUs fetched more than
+# max_age seconds ago and, to revalidate the catalog over several runs, the oldest refresh_fraction of
+# the remaining fresh ones. Returns (to_fetch, counts by reason).
+def plan_fetch(skus, ages, max_age, refresh_fraction=0.0, now=None):
+    now = time.time() if now is None else now
+    to_fetch = []
+    fresh = []
+    counts = {"new": 0, "failed": 0, "stale": 0, "refresh": 0, "fresh": 0}
+    for sku in dict.fromkeys(skus):
+        fetched_at, status = ages.get(sku, (None, None))
+        if fetched_at is None:
+            reason = "new"
+        elif status != "200":
+            reason = "failed"
+        elif now - fetched_at > max_age:
+            reason = "stale"
+        else:
+            fresh.append((fetched_at, sku))
+            continue
+        counts[reason] += 1
+        to_fetch.append(sku)
+    fresh.sort()
+    refresh = math.ceil(len(fresh) * refresh_fraction)
+    to_fetch.extend(sku for _, sku in fresh[:refresh])
+    counts["refresh"] = refresh
+    counts["fresh"] = len(fresh) - refresh
+    return to_fetch, counts
+
+# Writer stand-in for an incremental run: compares every extracted row with the snapshot, writes only
+# the differences to `diff_writer` and updates the snapshot. tracked are the columns that make up a
+# SKU's content; rows are keyed by the SKU they were requested as, or by key(row) when none is given,
+# so a SKU the site answers under another (canonical) SKU still matches plan_fetch.
+class DiffWriter:
+    def __init__(self, snapshot, rootdomain, diff_writer, tracked, key, ok=lambda row: row.get("status_code") == 200):
+        self.snapshot = snapshot
+        self.rootdomain = rootdomain
+        self.diff_writer = diff_writer
+        self.tracked = tracked
+        self.key = key
+        self.ok = ok
+        self.counts = {"new": 0, "changed": 0, "unchanged": 0, "failed": 0}
+        self.output_file = diff_writer.output_file
+
+    def append(self, row, sku=None):
+        if sku is None:
+            sku = self.key(row)
+        stamp = datetime.datetime.now().isoformat()
+        if not self.ok(row):
+            self.counts["failed"] += 1
+            self.snapshot.failed(self.rootdomain, sku, row.get("status_code"))
+            self.diff_writer.append({"sku": sku, "change": "failed", "status_code": row.get("status_code"), "error": row.get("error"),
+                                     "timestamp": stamp})
+            return
+        fields = {column: row.get(column) for column in self.tracked}
+        digest = content_hash([fields[column] for column in self.tracked])
+        previous = self.snapshot.get(self.rootdomain, sku)
+        if previous is None:
+            self.counts["new"] += 1
+            self.diff_writer.append({"sku": sku, "change": "new", "status_code": row.get("status_code"), "timestamp": stamp})
+        elif previous[0] != digest:
+            self.counts["changed"] += 1
+            old_fields = previous[1]
+            for column in self.tracked:
+                old, new = old_fields.get(column), json.loads(json.dumps(fields[column], default=str))
+                if old != new:
+                    self.diff_writer.append({"sku": sku, "change": "changed", "field": column, "old_value": old, "new_value": new,
+                                             "status_code": row.get("status_code"), "timestamp": stamp})
+        else:
+            self.counts["unchanged"] += 1
+        self.snapshot.put(self.rootdomain, sku, digest, fields, previous is None or previous[0] != digest)
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def close(self):
+        self.snapshot.close()
+        return self.diff_writer.close()
+
+    def summary(self):
+        return ", ".join(f"{count} {change}" for change, count in self.counts.items())
+
+def serialize_diff_value(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+def open_diff_report(output_file):
+    return StreamingExcelWriter(output_file, DIFF_HEADERS, "Changes", serialize=serialize_diff_value)
+
+# Diff report in the run's output format
+def open_diff_output(output_file, output_format="xlsx"):
+    return open_output_writer(output_file, DIFF_HEADERS, open_diff_report, output_format, serialize=serialize_diff_value)
+
+# Command line switches for incremental runs
+def add_incremental_arguments(parser):
+    parser.add_argument("--snapshot", help="SQLite snapshot of per-SKU content; enables incremental runs with a diff report")
+    parser.add_argument("--max-age", type=float, default=24, help="hours after which a SKU in the snapshot is fetched again")
+    parser.add_argument("--refresh-fraction", type=float, default=0.0,
+                        help="share of fresh SKUs (oldest first) fetched anyway to revalidate the catalog")
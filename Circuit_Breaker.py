@@ -0,0 +1,185 @@
+import asyncio
+import threading
+import time
+from collections import deque
+import requests
+from Retry_Policy import is_retryable_error, is_retryable_status
+from Run_Log import get_logger
+
+log = get_logger("breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+# Raised instead of sending while a circuit is open. Not retryable, so the caller's error row is
+# written straight away.
+class CircuitOpenError(requests.RequestException):
+    pass
+
+# Only failures that say the backend is unwell count: connection errors, timeouts and retryable statuses
+def is_backend_failure(response=None, error=None):
+    if error is not None:
+        return is_retryable_error(error)
+    return response is None or is_retryable_status(response.status_code)
+
+# Circuit breaker for one (endpoint, rootdomain). Closed, it tracks the outcome of the last `window`
+# requests (after their retries, so transient errors that a retry got past do not count) and opens
+# once at least `min_requests` of them are in and `failure_rate` of them failed. Open, requests are
+# refused for `open_seconds`; after that `probes` trial requests are let through (half-open). A
+# successful probe closes the circuit, a failed one opens it for another period.
+class CircuitBreaker:
+    def __init__(self, endpoint, rootdomain, failure_rate=0.5, window=50, min_requests=20, open_seconds=30, probes=1):
+        self.endpoint = endpoint
+        self.rootdomain = rootdomain
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.state = CLOSED
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.times_opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    # (allowed, wait): whether a request may be sent now and, if not, seconds until it is worth asking again
+    def try_acquire(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True, 0.0
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    return False, remaining
+                self.state = HALF_OPEN
+                log.info(f"Circuit for {self.endpoint} {self.rootdomain} half-open: sending a trial request")
+            if self.probes_in_flight < self.probes:
+                self.probes_in_flight += 1
+                return True, 0.0
+            return False, 0.1
+
+    def record(self, ok):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+                if ok:
+                    self.state = CLOSED
+                    self.outcomes.clear()
+                    log.warning(f"Circuit for {self.endpoint} {self.rootdomain} closed: trial request succeeded")
+                else:
+                    self._open("trial request failed")
+                return
+            if self.state == OPEN:
+                return
+            self.outcomes.append(ok)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_requests and failures >= self.failure_rate * len(self.outcomes):
+                self._open(f"{failures} of the last {len(self.outcomes)} requests failed")
+
+    # A request let through that was never sent (its deadline passed while it queued)
+    def abandon(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    # Outcome of a request once its retries are done; one that ended with neither a response nor an
+    # error (cancelled) says nothing about the backend
+    def record_request(self, response=None, error=None):
+        if response is None and error is None:
+            self.abandon()
+        else:
+            self.record(not is_backend_failure(response, error))
+
+    def _open(self, reason):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        log.warning(f"Circuit for {self.endpoint} {self.rootdomain} opened for {self.open_seconds:.0f}s: {reason}")
+
+    def _rejected(self):
+        with self._lock:
+            self.rejected += 1
+        return CircuitOpenError(f"Circuit open for {self.endpoint} {self.rootdomain}")
+
+    # Block until a request may be sent. With park_seconds=0 an open circuit fails fast; otherwise the
+    # caller is parked for up to park_seconds waiting for the circuit to close again.
+    # Parking stops at the request's deadline (a Deadlines.Deadline, which also follows the run
+    # deadline): the request then fails with DeadlineExceeded like any other that ran out of time.
+    def wait(self, park_seconds=0, deadline=None):
+        park_until = time.monotonic() + park_seconds
+        while True:
+            allowed, wait = self.try_acquire()
+            if allowed:
+                return
+            time.sleep(self._park_for(wait, park_until, deadline))
+
+    # How long to sleep before trying again, or the error once neither parking nor the deadline allow it
+    def _park_for(self, wait, park_until, deadline):
+        remaining = park_until - time.monotonic()
+        if remaining <= 0:
+            raise self._rejected()
+        left = deadline.remaining() if deadline is not None else None
+        if left is not None:
+            if left <= 0:
+                raise deadline.exceeded()
+            remaining = min(remaining, left)
+        return min(wait, remaining)
+
+    async def wait_async(self, park_seconds=0, deadline=None):
+        park_until = time.monotonic() + park_seconds
+        while True:
+            allowed, wait = self.try_acquire()
+            if allowed:
+                return
+            await asyncio.sleep(self._park_for(wait, park_until, deadline))
+
+    def summary(self):
+        with self._lock:
+            return f"{self.state}, opened {self.times_opened} times, {self.rejected} requests failed fast"
+
+# One breaker per (endpoint, rootdomain), all with the same settings; park_seconds picks between
+# failing fast (0) and parking requests while a circuit is open
+class CircuitBreakers:
+    def __init__(self, park_seconds=0, **settings):
+        self.breakers = {}
+        self._lock = threading.Lock()
+        self.configure(park_seconds, **settings)
+
+    # New settings apply to breakers created from now on
+    def configure(self, park_seconds=0, **settings):
+        with self._lock:
+            self.park_seconds = park_seconds
+            self.settings = settings
+
+    def get(self, endpoint, rootdomain):
+        key = (endpoint, rootdomain)
+        with self._lock:
+            if key not in self.breakers:
+                self.breakers[key] = CircuitBreaker(endpoint, rootdomain, **self.settings)
+            return self.breakers[key]
+
+    def clear(self):
+        with self._lock:
+            self.breakers = {}
+
+    # Breakers that opened at least once
+    def summary_lines(self):
+        with self._lock:
+            breakers = list(self.breakers.values())
+        return [f"Circuit for {breaker.endpoint} {breaker.rootdomain}: {breaker.summary()}" for breaker in breakers if breaker.times_opened]
+
+# Process-wide breakers shared by every API client
+BREAKERS = CircuitBreakers()
+
+# Command line switches shared by the scripts
+def add_breaker_arguments(parser):
+    parser.add_argument("--breaker-failure-rate", type=float, default=0.5, help="share of the recent requests failing after their retries that opens a circuit")
+    parser.add_argument("--breaker-open-seconds", type=float, default=30, help="seconds an open circuit refuses requests before a trial")
+    parser.add_argument("--breaker-park-seconds", type=float, default=0,
+                        help="seconds a request waits for an open circuit to close before failing (0 fails fast)")
+
+def configure_breakers(args):
+    BREAKERS.configure(park_seconds=args.breaker_park_seconds, failure_rate=args.breaker_failure_rate,
+                       open_seconds=args.breaker_open_seconds)
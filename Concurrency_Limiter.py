@@ -0,0 +1,74 @@
+import threading
+import time
+
+# AIMD limit on in-flight requests. Starts small and doubles (slow start) until the first sign of
+# trouble, then grows by about one slot per round of successful requests. Growth stops while the
+# smoothed latency sits above `latency_tolerance` times the best latency seen, and the limit
+# shrinks multiplicatively on timeouts and non-200 responses.
+class AdaptiveLimiter:
+    def __init__(self, max_limit, min_limit=1, initial_limit=8, backoff_ratio=0.5, latency_tolerance=3.0, smoothing=0.2, latency_floor=0.05):
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = float(max(self.min_limit, min(initial_limit, max_limit)))
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.latency_floor = latency_floor
+        self.in_flight = 0
+        self.slow_start = True
+        self.min_latency = None
+        self.smoothed_latency = None
+        self.peak_limit = self.limit
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, ok):
+        with self._condition:
+            self.in_flight -= 1
+            if ok:
+                self._on_success(latency)
+            else:
+                self._decrease(self.backoff_ratio)
+            self._condition.notify_all()
+
+    # Give back a slot that was never used for a request, without counting it either way
+    def cancel(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _on_success(self, latency):
+        self.min_latency = latency if self.min_latency is None else min(self.min_latency, latency)
+        if self.smoothed_latency is None:
+            self.smoothed_latency = latency
+        else:
+            self.smoothed_latency += self.smoothing * (latency - self.smoothed_latency)
+
+        if self.smoothed_latency > self.latency_tolerance * max(self.min_latency, self.latency_floor):
+            self.slow_start = False
+        elif self.slow_start:
+            self.limit = min(self.max_limit, self.limit + 1)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self.peak_limit = max(self.peak_limit, self.limit)
+
+    # At most one decrease per smoothed round trip, so a burst of failures from one window counts once
+    def _decrease(self, ratio):
+        now = time.monotonic()
+        if now - self._last_decrease < (self.smoothed_latency or 0):
+            return
+        self._last_decrease = now
+        self.slow_start = False
+        self.limit = max(self.min_limit, self.limit * ratio)
+        self.decreases += 1
+
+    def summary(self):
+        with self._condition:
+            return f"settled at {int(self.limit)} in-flight (peak {int(self.peak_limit)}, range {self.min_limit}-{self.max_limit}, {self.decreases} backoffs)"
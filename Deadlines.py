@@ -0,0 +1,116 @@
+import time
+from concurrent.futures import TimeoutError as FuturesTimeoutError, as_completed
+import requests
+from Run_Log import get_logger
+
+log = get_logger("deadline")
+
+# Status of a row whose request ran out of time: its own deadline or the run's passed
+TIMED_OUT = "Timed Out"
+
+# Raised instead of sending once a request's deadline (or the run's) has passed. Not retryable and never
+# counted by the breakers or limiters: the backend was not asked.
+class DeadlineExceeded(requests.RequestException):
+    pass
+
+# Point in time after which work is abandoned; seconds=None never expires. A deadline with a parent
+# (the run deadline) expires with it, whichever comes first.
+class Deadline:
+    def __init__(self, seconds=None, parent=None, name="Request"):
+        self.parent = parent
+        self.name = name
+        self.start(seconds)
+
+    def start(self, seconds):
+        self.seconds = seconds
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    # Seconds left (never negative), or None when neither this deadline nor its parent is set
+    def remaining(self):
+        own = None if self.expires_at is None else max(0.0, self.expires_at - time.monotonic())
+        inherited = self.parent.remaining() if self.parent is not None else None
+        if own is None or inherited is None:
+            return own if inherited is None else inherited
+        return min(own, inherited)
+
+    def expired(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    # The error for whichever deadline passed
+    def exceeded(self):
+        if self.parent is not None and self.parent.expired():
+            return self.parent.exceeded()
+        return DeadlineExceeded(f"{self.name} deadline of {self.seconds:g}s passed")
+
+# Process-wide run deadline: every request is cut short by it and the engines stop handing out work
+# once it passes. Not set (no deadline) until start_run_deadline.
+RUN_DEADLINE = Deadline(name="Run")
+
+# Connect and read timeouts for each attempt, plus an optional `total` in seconds for one request
+# across all its retries. Every attempt's timeouts are cut to what is left of the request's deadline,
+# so a hung connection cannot hold a worker past it.
+class Timeouts:
+    def __init__(self, connect=10, read=120, total=None):
+        self.connect = connect
+        self.read = read
+        self.total = total
+
+    def deadline(self):
+        return Deadline(self.total, RUN_DEADLINE)
+
+    # (connect, read) for the next attempt; raises DeadlineExceeded when nothing is left
+    def attempt(self, deadline):
+        remaining = deadline.remaining()
+        if remaining is None:
+            return self.connect, self.read
+        if remaining <= 0:
+            raise deadline.exceeded()
+        return min(self.connect, remaining), min(self.read, remaining)
+
+# Scripts may still pass a single number (used for both connect and read) or a (connect, read) pair
+def as_timeouts(timeout):
+    if isinstance(timeout, Timeouts):
+        return timeout
+    if isinstance(timeout, (tuple, list)):
+        return Timeouts(*timeout)
+    return Timeouts(timeout, timeout)
+
+# Status for a row whose request raised
+def failure_status(error):
+    return TIMED_OUT if isinstance(error, DeadlineExceeded) else "Request Failed"
+
+# as_completed that stops waiting at the run deadline: futures that have not started by then are
+# cancelled and handed to on_timeout(future); the ones already running are still waited for, and
+# finish quickly since their requests are cut to the deadline too
+def as_completed_by_deadline(futures, on_timeout, deadline=RUN_DEADLINE):
+    pending = set(futures)
+    try:
+        for future in as_completed(pending, timeout=deadline.remaining()):
+            pending.discard(future)
+            yield future
+    except FuturesTimeoutError:
+        cancelled = [future for future in pending if future.cancel()]
+        log.warning(f"{deadline.exceeded()}: cancelled {len(cancelled)} outstanding units")
+        for future in cancelled:
+            pending.discard(future)
+            on_timeout(future)
+        yield from as_completed(pending)
+
+# Start (or with seconds=None clear) the run deadline; called once at the start of a run
+def start_run_deadline(seconds=None):
+    RUN_DEADLINE.start(seconds)
+    if seconds is not None:
+        log.info(f"Run deadline in {seconds:g}s")
+
+# Command line switches shared by the scripts
+def add_timeout_arguments(parser):
+    parser.add_argument("--connect-timeout", type=float, default=10, help="seconds to wait for a connection")
+    parser.add_argument("--read-timeout", type=float, default=120, help="seconds to wait for response data")
+    parser.add_argument("--request-deadline", type=float, default=600,
+                        help="seconds one request may take across all its retries")
+    parser.add_argument("--deadline", type=float,
+                        help="run deadline in seconds: after it, outstanding work is cancelled, written as timed-out rows and the partial output saved")
+
+def timeouts_from_args(args):
+    return Timeouts(args.connect_timeout, args.read_timeout, args.request_deadline)
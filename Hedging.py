@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+# Latency percentile of a sorted list
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+# Hedging state for one (endpoint, rootdomain). The threshold is the `quantile` of the last `window`
+# primary latencies, refreshed every `refresh` samples once `min_samples` are in; until then nothing
+# is hedged. Hedges are capped at `max_ratio` of the requests sent so far. For the report it keeps
+# what every request took (the first response) and what its primary request took on its own, which
+# is what the request would have taken without hedging.
+class HedgeTracker:
+    def __init__(self, endpoint, rootdomain, quantile=0.95, max_ratio=0.05, window=1000, min_samples=50, refresh=20):
+        self.endpoint = endpoint
+        self.rootdomain = rootdomain
+        self.quantile = quantile
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.refresh = refresh
+        self.threshold = None
+        self.requests = 0
+        self.hedges = 0
+        self.capped = 0
+        self.hedge_wins = 0
+        self.served = array("d")
+        self.primary = array("d")
+        self._window = deque(maxlen=window)
+        self._since_refresh = 0
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.requests += 1
+            return self.threshold
+
+    # Whether a hedge may go out now without passing the cap
+    def try_hedge(self):
+        with self._lock:
+            if self.hedges + 1 > self.max_ratio * self.requests:
+                self.capped += 1
+                return False
+            self.hedges += 1
+            return True
+
+    # Latency of a primary request, whether or not it was the one used
+    def primary_finished(self, latency):
+        with self._lock:
+            self.primary.append(latency)
+            self._window.append(latency)
+            self._since_refresh += 1
+            if len(self._window) >= self.min_samples and self._since_refresh >= self.refresh:
+                self.threshold = percentile(sorted(self._window), self.quantile)
+                self._since_refresh = 0
+
+    def served_after(self, latency, hedge_won):
+        with self._lock:
+            self.served.append(latency)
+            if hedge_won:
+                self.hedge_wins += 1
+
+    def summary(self):
+        with self._lock:
+            served, primary = sorted(self.served), sorted(self.primary)
+            requests, hedges, capped, wins, threshold = self.requests, self.hedges, self.capped, self.hedge_wins, self.threshold
+        text = (f"{hedges} hedges for {requests} requests ({hedges / max(requests, 1):.1%}, {capped} held back by the cap), "
+                f"hedge answered first {wins} times")
+        if threshold is not None:
+            text += f", threshold {threshold * 1000:.0f}ms"
+        return (text + f"; p99 {percentile(primary, 0.99) * 1000:.0f}ms -> {percentile(served, 0.99) * 1000:.0f}ms, "
+                f"slowest {percentile(primary, 1) * 1000:.0f}ms -> {percentile(served, 1) * 1000:.0f}ms (without -> with hedging)")
+
+# Hedged requests: when a request has not answered after its (endpoint, rootdomain)'s threshold, the
+# same request is sent again and whichever response comes first is used. The other one is left to
+# finish (its latency is what the report compares against) and discarded. An attempt that raised only
+# wins when the other one raised too. Off unless enabled.
+class HedgePolicy:
+    def __init__(self, enabled=False, **settings):
+        self.trackers = {}
+        self._lock = threading.Lock()
+        self.configure(enabled, **settings)
+
+    # New settings apply to trackers created from now on
+    def configure(self, enabled=False, **settings):
+        with self._lock:
+            self.enabled = enabled
+            self.settings = settings
+
+    def tracker(self, endpoint, rootdomain):
+        key = (endpoint, rootdomain)
+        with self._lock:
+            if key not in self.trackers:
+                self.trackers[key] = HedgeTracker(endpoint, rootdomain, **self.settings)
+            return self.trackers[key]
+
+    def clear(self):
+        with self._lock:
+            self.trackers = {}
+
+    def summary_lines(self):
+        with self._lock:
+            trackers = list(self.trackers.values())
+        return [f"Hedging for {tracker.endpoint} {tracker.rootdomain}: {tracker.summary()}" for tracker in trackers if tracker.requests]
+
+    # send(sent) makes one attempt and calls sent() once it has its connection slot; both copies run on
+    # `pool` so the caller can return on the first answer
+    def call(self, endpoint, rootdomain, send, pool):
+        tracker = self.tracker(endpoint, rootdomain)
+        clock = SendClock(threading.Event())
+        primary = pool.submit(send, clock.sent)
+        primary.add_done_callback(lambda future: clock.primary_done(tracker))
+        clock.event.wait()
+        if clock.sent_at is None:
+            return primary.result()  # Failed before it was sent
+        threshold = tracker.started()
+        if threshold is None or wait([primary], timeout=max(0.0, threshold - clock.elapsed())).done or not tracker.try_hedge():
+            try:
+                return primary.result()
+            finally:
+                tracker.served_after(clock.elapsed(), False)
+        hedge = pool.submit(send, None)
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is not None or not pending:
+                break
+        if winner is None:
+            winner = primary
+        tracker.served_after(clock.elapsed(), winner is hedge)
+        return winner.result()
+
+    async def call_async(self, endpoint, rootdomain, send):
+        tracker = self.tracker(endpoint, rootdomain)
+        clock = SendClock(asyncio.Event())
+        primary = asyncio.ensure_future(send(clock.sent))
+        primary.add_done_callback(lambda task: clock.primary_done(tracker))
+        hedge = None
+        try:
+            await clock.event.wait()
+            if clock.sent_at is None:
+                return await primary
+            threshold = tracker.started()
+            if threshold is not None:
+                await asyncio.wait({primary}, timeout=max(0.0, threshold - clock.elapsed()))
+            if primary.done() or threshold is None or not tracker.try_hedge():
+                response = await primary
+                tracker.served_after(clock.elapsed(), False)
+                return response
+            hedge = asyncio.ensure_future(send(None))
+            pending = {primary, hedge}
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if not task.cancelled() and task.exception() is None), None)
+                if winner is not None or not pending:
+                    break
+            if winner is None:
+                winner = primary
+            tracker.served_after(clock.elapsed(), winner is hedge)
+            for task in pending:
+                task.add_done_callback(discard)
+            return winner.result()
+        except asyncio.CancelledError:
+            for task in (primary, hedge):
+                if task is not None:
+                    task.cancel()
+            raise
+
+# When the primary attempt went out. Latencies and the threshold count from there, so time spent
+# queueing for the breaker or limiter is not raced by a hedge that would queue behind it.
+class SendClock:
+    def __init__(self, event):
+        self.event = event
+        self.sent_at = None
+
+    def sent(self):
+        self.sent_at = time.monotonic()
+        self.event.set()
+
+    def elapsed(self):
+        return time.monotonic() - self.sent_at
+
+    def primary_done(self, tracker):
+        if self.sent_at is not None:
+            tracker.primary_finished(self.elapsed())
+        self.event.set()
+
+# Collect the loser's outcome so asyncio does not report an unretrieved exception
+def discard(task):
+    if not task.cancelled():
+        task.exception()
+
+# Process-wide hedging settings and trackers shared by every API client
+HEDGING = HedgePolicy()
+
+# Command line switches shared by the scripts
+def add_hedging_arguments(parser):
+    parser.add_argument("--hedge", action="store_true", help="send a duplicate of requests slower than the hedge quantile; first response wins")
+    parser.add_argument("--hedge-quantile", type=float, default=0.95, help="latency quantile per endpoint and rootdomain after which a request is hedged")
+    parser.add_argument("--hedge-max-ratio", type=float, default=0.05, help="most hedges as a share of requests")
+
+def configure_hedging(args):
+    HEDGING.configure(args.hedge, quantile=args.hedge_quantile, max_ratio=args.hedge_max_ratio)
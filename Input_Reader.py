@@ -0,0 +1,144 @@
+import csv
+import json
+import os
+import re
+import sys
+import zipfile
+
+# Input readers stream rows one at a time, so a run starts on the first SKU of a huge file and only
+# ever holds the rows it is working on. openpyxl and pyarrow are imported by the reader that needs them.
+# Each reader opens its file and checks the header straight away (a missing column fails before the
+# run writes anything) and returns an iterator over the data rows.
+
+# Read-only mode parses the sheet as it is iterated
+def xlsx_rows(path, columns):
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    header = next(rows, ())
+    try:
+        indexes = [column_index(path, header, column) for column in columns]
+    except ValueError:
+        workbook.close()
+        raise
+    return picked_columns(rows, indexes, workbook.close)
+
+def csv_rows(path, columns):
+    input_file = open(path, newline="", encoding="utf-8-sig")
+    rows = csv.reader(input_file)
+    header = next(rows, [])
+    try:
+        indexes = [column_index(path, header, column) for column in columns]
+    except ValueError:
+        input_file.close()
+        raise
+    return picked_columns(rows, indexes, input_file.close)
+
+def picked_columns(rows, indexes, close):
+    try:
+        for row in rows:
+            yield tuple(row[index] if index < len(row) else None for index in indexes)
+    finally:
+        close()
+
+# One JSON object per line, as written by the jsonl output format
+def jsonl_rows(path, columns):
+    input_file = open(path, encoding="utf-8")
+
+    def entries():
+        with input_file:
+            for line in input_file:
+                if line.strip():
+                    entry = json.loads(line)
+                    yield tuple(entry.get(column) for column in columns)
+    return entries()
+
+def parquet_rows(path, columns):
+    import pyarrow.parquet  # Only needed for Parquet input
+    parquet_file = pyarrow.parquet.ParquetFile(path)
+    for column in columns:
+        column_index(path, parquet_file.schema_arrow.names, column)
+
+    def batches():
+        for batch in parquet_file.iter_batches(columns=columns):
+            values = batch.to_pydict()
+            yield from zip(*(values[column] for column in columns))
+    return batches()
+
+# "-": one value per line on stdin; a first line equal to the column name is a header and skipped
+def stdin_rows(columns):
+    if len(columns) != 1:
+        raise ValueError("stdin input carries a single column")
+
+    def lines():
+        for number, line in enumerate(sys.stdin):
+            value = line.strip()
+            if value and not (number == 0 and value == columns[0]):
+                yield (value,)
+    return lines()
+
+def column_index(path, header, column):
+    header = [str(name).strip() if name is not None else None for name in header]
+    if column not in header:
+        raise ValueError(f"{path} has no column {column!r}")
+    return header.index(column)
+
+READERS = {
+    ".xlsx": xlsx_rows,
+    ".xlsm": xlsx_rows,
+    ".csv": csv_rows,
+    ".jsonl": jsonl_rows,
+    ".parquet": parquet_rows,
+}
+
+# Lazily yield a tuple of `columns` per data row of an xlsx, csv, jsonl or parquet file, or of stdin for "-"
+def read_rows(path, columns):
+    if path == "-":
+        return stdin_rows(columns)
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"Unsupported input {path}: expected one of {', '.join(READERS)} or - for stdin")
+    return READERS[extension](path, columns)
+
+# Lazily yield the non-blank values of one column
+def read_column(path, column="sku"):
+    return (value for (value,) in read_rows(path, [column]) if value is not None and value != "")
+
+# Data rows in an input file as far as its metadata tells without parsing it: the sheet dimension of an
+# xlsx (or, for sheets saved without one such as the scripts' own write-only output, the number of its
+# last row) or the row count of a parquet file. Blank rows count too. None for csv, jsonl and stdin.
+def row_count(path):
+    extension = "" if path == "-" else os.path.splitext(path)[1].lower()
+    if READERS.get(extension) is xlsx_rows:
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True)
+        try:
+            sheet = workbook.active
+            max_row = sheet.max_row or last_row_number(path, sheet._worksheet_path)
+        finally:
+            workbook.close()
+        return None if max_row is None else max(0, max_row - 1)
+    if extension == ".parquet":
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetFile(path).metadata.num_rows
+    return None
+
+ROW_NUMBER = re.compile(rb'<row [^>]*?r="(\d+)"')
+
+# Number of the last <row> in a worksheet's XML, scanned as raw bytes rather than parsed
+def last_row_number(path, member):
+    last = None
+    with zipfile.ZipFile(path) as archive, archive.open(member) as sheet:
+        tail = b""
+        for chunk in iter(lambda: sheet.read(1 << 20), b""):
+            text = tail + chunk
+            start = text.rfind(b"<row ")
+            match = ROW_NUMBER.match(text, start) if start >= 0 else None
+            if match:
+                last = int(match.group(1))
+            tail = text[-64:]  # A tag split across chunks is found on the next read
+    return last
+
+# Command line switch for scripts that read a SKU list
+def add_input_arguments(parser, default=None):
+    parser.add_argument("--input", default=default, help="SKU list: .xlsx, .csv, .jsonl or .parquet file with a sku column, or - for stdin")
@@ -0,0 +1,156 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Circuit_Breaker import add_breaker_arguments, configure_breakers
+from Deadlines import add_timeout_arguments, start_run_deadline, timeouts_from_args
+from Hedging import add_hedging_arguments, configure_hedging
+from Output_Writer import add_output_arguments, output_path
+from Response_Cache import add_cache_arguments, cache_from_args
+from Run_Log import RunLog, add_logging_arguments, get_logger
+from Run_Metrics import MetricsReporter, add_metrics_arguments
+
+log = get_logger("markets")
+
+STEPS = ["search", "pdp", "reviews", "pipeline"]
+
+# Output names the scripts derive from the rootdomain
+def search_file_for(rootdomain):
+    return fr"Search_{rootdomain.replace('.','_').replace('/','_')}.xlsx"
+
+def pdp_file_for(rootdomain):
+    return fr"pdp_{rootdomain.replace('.','-').replace('/','-')}.xlsx"
+
+# Per-market variant of a shared file name, e.g. metrics.json -> metrics_hp_com_au.json
+def market_file(path, rootdomain):
+    stem, extension = os.path.splitext(path)
+    return f"{stem}_{rootdomain.replace('.', '_').replace('/', '_')}{extension}"
+
+# A market's "timeout" (seconds, or [connect, read]) overrides the command line timeouts
+def market_timeout(market, args):
+    return market.get("timeout") or timeouts_from_args(args)
+
+def run_search(market, args, cache):
+    import Search_Script
+    Search_Script.main(market["workers"], market["rootdomain"], market["terms"], market.get("max_pages", 4), market_timeout(market, args),
+                       args.resume, cache, args.format, args.report_rows)
+
+# Input defaults to this market's search output when the market ran a search step first
+def run_pdp(market, args, cache):
+    import PDP_Script
+    rootdomain = market["rootdomain"]
+    input_file = market.get("input") or output_path(search_file_for(rootdomain), args.format)
+    PDP_Script.main(market_timeout(market, args), market.get("isapi", True), rootdomain, market["workers"], input_file,
+                    pdp_file_for(rootdomain), market.get("engine", "thread"), market.get("batch_size", 1), args.resume, cache,
+                    args.format, args.report_rows)
+
+# SKUs come from the market's list or, without one, from its PDP output, which also plans the pages per SKU
+def run_reviews(market, args, cache):
+    import Reviews_Script
+    rootdomain = market["rootdomain"]
+    pdp_output = market.get("pdp_output") or output_path(pdp_file_for(rootdomain), args.format)
+    review_counts = Reviews_Script.read_review_counts(pdp_output) if os.path.exists(pdp_output) else {}
+    skus = market.get("skus") or list(review_counts)
+    if not skus:
+        log.warning("No SKUs for reviews: give 'skus' or run the pdp step first")
+        return
+    Reviews_Script.main(args.resume, cache, review_counts, args.format, args.report_rows, skus, market["workers"], rootdomain,
+                        market_timeout(market, args))
+
+def run_pipeline(market, args, cache):
+    import Pipeline_Script
+    Pipeline_Script.main(market["workers"], market["rootdomain"], market["terms"], market.get("max_pages", 4), market_timeout(market, args),
+                         cache=cache, output_format=args.format, report_rows=args.report_rows)
+
+STEP_RUNNERS = {
+    "search": run_search,
+    "pdp": run_pdp,
+    "reviews": run_reviews,
+    "pipeline": run_pipeline,
+}
+
+# Runs in a pool process: one market's steps in order, with its own logger, metrics and client, so the
+# market's workers value is its concurrency ceiling and parsing/styling use this process's core.
+# --deadline applies to each market, counted from when it starts.
+def run_market(market, args):
+    os.chdir(args.output_dir)
+    rootdomain = market["rootdomain"]
+    log_file = market_file(args.log_file, rootdomain) if args.log_file else None
+    snapshot_path = market_file(args.metrics, rootdomain) if args.metrics else None
+    configure_breakers(args)
+    configure_hedging(args)
+    start = time.monotonic()
+    with RunLog(args.log_level, log_file, label=rootdomain), MetricsReporter(interval=args.metrics_interval, snapshot_path=snapshot_path):
+        cache = cache_from_args(args)
+        start_run_deadline(args.deadline)
+        for step in market["steps"]:
+            STEP_RUNNERS[step](market, args, cache)
+    return time.monotonic() - start
+
+# Markets file: a JSON list of {"rootdomain": ..., "steps": [...], "workers": ..., plus what the steps need:
+# "terms"/"max_pages" for search and pipeline, "input"/"engine"/"batch_size"/"isapi" for pdp,
+# "skus"/"pdp_output" for reviews, optional "timeout"}. Relative input paths are relative to the file.
+def load_markets(path, default_workers):
+    with open(path, encoding="utf-8") as markets_file:
+        markets = json.load(markets_file)
+    base = os.path.dirname(os.path.abspath(path))
+    seen = set()
+    for market in markets:
+        rootdomain = market["rootdomain"]
+        if rootdomain in seen:
+            raise SystemExit(f"{rootdomain} is listed twice; give it one entry with several steps")
+        seen.add(rootdomain)
+        market["steps"] = market.get("steps") or [market.get("step", "pipeline")]
+        for step in market["steps"]:
+            if step not in STEP_RUNNERS:
+                raise SystemExit(f"{rootdomain}: unknown step {step!r} (expected one of {', '.join(STEPS)})")
+        market.setdefault("workers", default_workers)
+        for key in ("input", "pdp_output"):
+            if market.get(key):
+                market[key] = os.path.join(base, market[key])
+    return markets
+
+# Markets run in parallel on a pool of `processes` spawned processes; each writes its outputs, journals,
+# logs and metrics under output_dir with the rootdomain in the name
+def main(markets, args):
+    args.output_dir = os.path.abspath(args.output_dir)
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.cache:
+        args.cache = os.path.abspath(args.cache)
+    processes = min(args.processes or os.cpu_count() or 1, len(markets))
+    log.info(f"Running {len(markets)} markets on {processes} processes")
+    failed = []
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {executor.submit(run_market, market, args): market["rootdomain"] for market in markets}
+        for future in as_completed(futures):
+            rootdomain = futures[future]
+            try:
+                log.info(f"{rootdomain} finished in {future.result():.1f}s")
+            except Exception as e:
+                log.error(f"{rootdomain} failed: {e}")
+                failed.append(rootdomain)
+    if failed:
+        log.error(f"{len(failed)} of {len(markets)} markets failed: {', '.join(failed)}")
+    return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several rootdomains in parallel processes")
+    parser.add_argument("markets", help="JSON file listing the markets to run")
+    parser.add_argument("--processes", type=int, help="markets run at once (default: CPU count)")
+    parser.add_argument("--workers", type=int, default=50, help="default per-market concurrency ceiling")
+    parser.add_argument("--output-dir", default=".", help="directory for every market's outputs")
+    parser.add_argument("--resume", action="store_true", help="resume each market from its run journals")
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    add_output_arguments(parser)
+    add_logging_arguments(parser)
+    add_breaker_arguments(parser)
+    add_timeout_arguments(parser)
+    add_hedging_arguments(parser)
+    args = parser.parse_args()
+    markets = load_markets(args.markets, args.workers)
+    with RunLog(args.log_level):
+        failed = main(markets, args)
+    raise SystemExit(1 if failed else 0)
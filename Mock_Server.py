@@ -0,0 +1,179 @@
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Review count for a SKU; also reported as numberOfCustomerReviews on the product page
+def review_total(sku, reviews_per_sku=None):
+    if reviews_per_sku is not None:
+        return reviews_per_sku
+    return sum(map(ord, sku)) % 60
+
+# Synthetic payloads shaped like the extractor service responses
+def sku_payload(rootdomain, sku, reviews_per_sku=None):
+    return {
+        "price": "199.99",
+        "condition": 1,
+        "source": "mock",
+        "skuEntry": {
+            "sku": sku,
+            "url": f"https://www.{rootdomain}/{sku}",
+            "name": f"Product {sku}",
+            "brand": "HP",
+            "availability": 1,
+            "price": "199.99",
+            "currency": "USD",
+            "rootDomain": rootdomain,
+            "attributes": {"color": "black"},
+            "numberOfCustomerReviews": review_total(sku, reviews_per_sku),
+            "skuImages": {f"productImageUrl{i}": f"https://img.{rootdomain}/{sku}/{i}.jpg" for i in range(1, 11)},
+        },
+    }
+
+# Result count for a term, so result lists end at different pages with a short last page
+def search_total(term, search_results=None):
+    if search_results is not None:
+        return search_results
+    return 60 + 13 * len(term)
+
+def search_payload(rootdomain, term, page, page_size=24, search_results=None):
+    count = max(0, min(page_size, search_total(term, search_results) - (page - 1) * page_size))
+    return {
+        "searchItems": [
+            {
+                "title": f"{term} {page}-{index}",
+                "sku": f"{term}-{page}-{index}",
+                "url": f"https://www.{rootdomain}/{term}-{page}-{index}",
+                "rootdomain": rootdomain,
+                "sellerSku": {"sellerId": "hp", "skuEntry": {"imageUrl": f"https://img.{rootdomain}/{term}.jpg"}},
+            }
+            for index in range(1, count + 1)
+        ]
+    }
+
+def review_payload(sku, page, page_size=10, reviews_per_sku=None):
+    count = max(0, min(page_size, review_total(sku, reviews_per_sku) - (page - 1) * page_size))
+    return {
+        "reviewItems": [
+            {"reviewId": f"{sku}-{page}-{index}", "rating": 5, "title": "Great", "text": "Works well", "link": f"https://reviews/{sku}"}
+            for index in range(1, count + 1)
+        ]
+    }
+
+# Latency distribution from a spec string: "fixed:0.05", "uniform:0.01:0.2", "exponential:0.05" (mean)
+# or "lognormal:0.05:0.5" (median, sigma); returns a function giving one delay in seconds
+def latency_sampler(spec):
+    kind, *args = spec.split(":")
+    args = [float(arg) for arg in args]
+    if kind == "fixed":
+        return lambda: args[0]
+    if kind == "uniform":
+        return lambda: random.uniform(args[0], args[1])
+    if kind == "exponential":
+        return lambda: random.expovariate(1 / args[0])
+    if kind == "lognormal":
+        mu = math.log(args[0])
+        return lambda: random.lognormvariate(mu, args[1])
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+# How the stand-in behaves: per-request latency, the share of requests answered with a 503, fixed
+# result and review counts (None keeps the per-term / per-SKU defaults), and an optional directory
+# of recorded bodies (apiextraction.json, extraction.json, search.json, review.json) served as-is
+class MockConfig:
+    def __init__(self, latency="fixed:0", error_rate=0.0, search_results=None, reviews_per_sku=None, recordings=None):
+        self.latency = latency
+        self.sample_latency = latency_sampler(latency)
+        self.error_rate = error_rate
+        self.search_results = search_results
+        self.reviews_per_sku = reviews_per_sku
+        self.recorded = {}
+        if recordings:
+            for endpoint in ["apiextraction", "extraction", "search", "review"]:
+                path = os.path.join(recordings, f"{endpoint}.json")
+                if os.path.exists(path):
+                    with open(path, "rb") as recorded_file:
+                        self.recorded[endpoint] = recorded_file.read()
+
+ENDPOINT_NAMES = {
+    "/api/apiextraction": "apiextraction",
+    "/api/extraction/sku": "extraction",
+    "/api/search": "search",
+    "/api/review": "review",
+}
+
+class MockExtractorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        config = self.server.config
+        parsed = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        rootdomain = query.get("rootdomain", "")
+        page = int(query.get("page", 1))
+        endpoint = ENDPOINT_NAMES.get(parsed.path)
+        if endpoint is None:
+            self.send_error(404)
+            return
+
+        delay = config.sample_latency()
+        if delay > 0:
+            time.sleep(delay)
+        if config.error_rate and random.random() < config.error_rate:
+            self.send_body(503, b"Service Unavailable")
+            return
+
+        if endpoint in config.recorded:
+            self.send_body(200, config.recorded[endpoint])
+            return
+        if endpoint == "apiextraction":
+            skus = query.get("skus", "").split(",")
+            body = {"sellerSkus": [sku_payload(rootdomain, sku, config.reviews_per_sku) for sku in skus]}
+        elif endpoint == "extraction":
+            body = {"sellerSku": sku_payload(rootdomain, query.get("sku", ""), config.reviews_per_sku)}
+        elif endpoint == "search":
+            body = search_payload(rootdomain, query.get("term", ""), page, search_results=config.search_results)
+        else:
+            body = review_payload(query.get("sku", ""), page, reviews_per_sku=config.reviews_per_sku)
+        self.send_body(200, json.dumps(body).encode())
+
+    def send_body(self, status_code, data):
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+class MockExtractorServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+    config = MockConfig()
+
+# Start the stand-in server on a background thread and return it
+def start_server(host="127.0.0.1", port=0, config=None):
+    server = MockExtractorServer((host, port), MockExtractorHandler)
+    if config is not None:
+        server.config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--latency", default="fixed:0", help="fixed:S, uniform:LO:HI, exponential:MEAN or lognormal:MEDIAN:SIGMA (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    parser.add_argument("--search-results", type=int, help="results per search term (default depends on the term)")
+    parser.add_argument("--reviews-per-sku", type=int, help="reviews per SKU (default depends on the SKU)")
+    parser.add_argument("--recordings", help="directory of recorded response bodies served instead of synthetic ones")
+    args = parser.parse_args()
+    config = MockConfig(args.latency, args.error_rate, args.search_results, args.reviews_per_sku, args.recordings)
+    server = start_server(port=args.port, config=config)
+    print(f"Mock extractor listening on http://{server.server_address[0]}:{server.server_address[1]}")
+    threading.Event().wait()
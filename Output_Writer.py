@@ -0,0 +1,268 @@
+import csv
+import json
+import os
+from copy import copy
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import PatternFill
+from openpyxl.utils import get_column_letter
+from Run_Log import get_logger
+
+log = get_logger("output")
+
+highlight_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
+
+_MULTIPLE = object()
+
+# Convert lists or dictionaries to strings
+def stringify(value):
+    if isinstance(value, (list, dict)):
+        return str(value)
+    return value
+
+# Tracks, in constant memory, whether a column is blank and whether all its meaningful values are equal
+class ColumnCheck:
+    def __init__(self, ignore_values):
+        self.ignore_values = ignore_values
+        self.blank = True
+        self.value = None
+
+    def add(self, value):
+        if value not in [None, ""]:
+            self.blank = False
+        if value in self.ignore_values or self.value is _MULTIPLE:
+            return
+        if self.value is None:
+            self.value = value
+        elif self.value != value:
+            self.value = _MULTIPLE
+
+    @property
+    def all_same(self):
+        return self.value is not None and self.value is not _MULTIPLE
+
+# Write-only workbook that styles each row as it is appended, so nothing is held in memory or reloaded.
+# row_fills(data, values) returns {header: fill} for one row and may fill in derived cells of `values`
+# (such as duplicate markers) in place. Header highlights depend on the whole
+# column, so they are tracked incrementally and emitted as always-true conditional formats on close.
+class StreamingExcelWriter:
+    def __init__(self, output_file, headers, title, row_fills=None, serialize=stringify,
+                 same_value_ignore=(None, ""), highlight_blank_columns=False, write_empty=False):
+        self.output_file = output_file
+        self.headers = headers
+        self.title = title
+        self.row_fills = row_fills
+        self.serialize = serialize
+        self.highlight_blank_columns = highlight_blank_columns
+        self.write_empty = write_empty
+        self.column_checks = [ColumnCheck(list(same_value_ignore)) for _ in headers]
+        self.rows = 0
+        self._styles = {}
+        self.wb = None
+        self.ws = None
+
+    def _open(self):
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(self.title)
+        self.ws.append(self.headers)
+
+    def append(self, data):
+        if self.wb is None:
+            self._open()
+        values = [self.serialize(data.get(field, "")) for field in self.headers]
+        fills = self.row_fills(data, values) if self.row_fills else {}
+        row = []
+        for header, value, check in zip(self.headers, values, self.column_checks):
+            check.add(value)
+            fill = fills.get(header)
+            if fill is None:
+                row.append(value)
+            else:
+                cell = WriteOnlyCell(self.ws, value=value)
+                cell._style = copy(self._style_for(fill))
+                row.append(cell)
+        self.ws.append(row)
+        self.rows += 1
+
+    # Registering a fill with the workbook hashes the whole style, so do it once per distinct fill
+    def _style_for(self, fill):
+        style = self._styles.get(id(fill))
+        if style is None:
+            cell = WriteOnlyCell(self.ws)
+            cell.fill = fill
+            style = self._styles[id(fill)] = cell._style
+        return style
+
+    def extend(self, data_list):
+        for data in data_list:
+            self.append(data)
+
+    # Save the workbook and return the number of data rows; without rows only write_empty writers create a file
+    def close(self):
+        if self.wb is None:
+            if not self.write_empty:
+                return 0
+            self._open()
+        for col_idx, check in enumerate(self.column_checks, start=1):
+            fill = None
+            if check.all_same:
+                fill = red_fill
+            elif check.blank and self.highlight_blank_columns:
+                fill = highlight_fill
+            if fill is not None:
+                self.ws.conditional_formatting.add(f"{get_column_letter(col_idx)}1", FormulaRule(formula=["TRUE"], fill=fill))
+        self.wb.save(self.output_file)
+        return self.rows
+
+# CSV rows with the same headers and serialisation as the Excel output, without any styling
+class CsvWriter:
+    def __init__(self, output_file, headers, serialize=stringify, prepare=None, write_empty=False):
+        self.output_file = output_file
+        self.headers = headers
+        self.serialize = serialize
+        self.prepare = prepare
+        self.write_empty = write_empty
+        self.rows = 0
+        self._file = None
+
+    def _open(self):
+        self._file = open(self.output_file, "w", newline="", encoding="utf-8")
+        self._csv = csv.writer(self._file)
+        self._csv.writerow(self.headers)
+
+    def append(self, data):
+        if self._file is None:
+            self._open()
+        if self.prepare:
+            self.prepare(data)
+        self._csv.writerow([self.serialize(data.get(field, "")) for field in self.headers])
+        self.rows += 1
+
+    def extend(self, data_list):
+        for data in data_list:
+            self.append(data)
+
+    def close(self):
+        if self._file is None:
+            if not self.write_empty:
+                return 0
+            self._open()
+        self._file.close()
+        return self.rows
+
+# One JSON object per row, keyed by header; lists and dicts stay structured
+class JsonlWriter(CsvWriter):
+    def _open(self):
+        self._file = open(self.output_file, "w", encoding="utf-8")
+
+    def append(self, data):
+        if self._file is None:
+            self._open()
+        if self.prepare:
+            self.prepare(data)
+        self._file.write(json.dumps({field: data.get(field) for field in self.headers}, default=str) + "\n")
+        self.rows += 1
+
+# Parquet file written in row groups of batch_rows. Every column is stored as a nullable string so that
+# mixed values (a status code that is sometimes "Request Failed") never break the schema.
+class ParquetWriter:
+    def __init__(self, output_file, headers, serialize=stringify, prepare=None, write_empty=False, batch_rows=10000):
+        import pyarrow  # Only needed for Parquet output
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.output_file = output_file
+        self.headers = headers
+        self.serialize = serialize
+        self.prepare = prepare
+        self.write_empty = write_empty
+        self.batch_rows = batch_rows
+        self.schema = pyarrow.schema([(field, pyarrow.string()) for field in headers])
+        self.columns = [[] for _ in headers]
+        self.rows = 0
+        self._writer = None
+
+    def append(self, data):
+        if self.prepare:
+            self.prepare(data)
+        for column, field in zip(self.columns, self.headers):
+            value = self.serialize(data.get(field))
+            column.append(None if value is None else str(value))
+        self.rows += 1
+        if len(self.columns[0]) >= self.batch_rows:
+            self._flush()
+
+    def extend(self, data_list):
+        for data in data_list:
+            self.append(data)
+
+    def _flush(self):
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.output_file, self.schema)
+        arrays = [self._pa.array(column, type=self._pa.string()) for column in self.columns]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self.schema))
+        self.columns = [[] for _ in self.headers]
+
+    def close(self):
+        if self.rows == 0 and not self.write_empty:
+            return 0
+        if self.columns[0] or self._writer is None:
+            self._flush()
+        self._writer.close()
+        return self.rows
+
+OUTPUT_FORMATS = {
+    "csv": CsvWriter,
+    "jsonl": JsonlWriter,
+    "parquet": ParquetWriter,
+}
+
+# Feeds every row to a dataset writer and the first report_rows rows to a styled Excel report
+class ReportingWriter:
+    def __init__(self, writer, report, report_rows):
+        self.writer = writer
+        self.report = report
+        self.report_rows = report_rows
+        self.output_file = writer.output_file
+
+    @property
+    def rows(self):
+        return self.writer.rows
+
+    def append(self, data):
+        self.writer.append(data)
+        if self.report.rows < self.report_rows:
+            self.report.append(data)
+
+    def extend(self, data_list):
+        for data in data_list:
+            self.append(data)
+
+    def close(self):
+        if self.report.close():
+            log.info(f"Report saved to {self.report.output_file}")
+        return self.writer.close()
+
+# Dataset file next to the workbook name, e.g. Search_hp_com_au.xlsx -> Search_hp_com_au.parquet
+def output_path(output_file, output_format):
+    return f"{os.path.splitext(output_file)[0]}.{output_format}"
+
+# Writer for a script's rows in the chosen format. "xlsx" is the styled workbook from open_report;
+# other formats write a plain dataset and, with report_rows, a styled workbook of the first rows.
+# prepare(data) fills in derived columns that the Excel row styling would otherwise compute.
+def open_output_writer(output_file, headers, open_report, output_format="xlsx", report_rows=0, serialize=stringify,
+                       prepare=None, write_empty=False):
+    if output_format == "xlsx":
+        return open_report(output_file)
+    writer = OUTPUT_FORMATS[output_format](output_path(output_file, output_format), headers, serialize=serialize,
+                                           prepare=prepare, write_empty=write_empty)
+    if report_rows:
+        return ReportingWriter(writer, open_report(output_file), report_rows)
+    return writer
+
+# Command line switches shared by the scripts
+def add_output_arguments(parser):
+    parser.add_argument("--format", default="xlsx", choices=["xlsx", *OUTPUT_FORMATS], help="output file format")
+    parser.add_argument("--report-rows", type=int, default=0, help="with a non-xlsx format, also write a highlighted workbook of this many rows")
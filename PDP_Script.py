@@ -1,310 +1,590 @@
-import pandas as pd
 import requests
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import PatternFill
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import argparse
+import asyncio
 import datetime
+import itertools
+import json
+from collections import Counter
+from operator import itemgetter
+from Api_Client import AsyncApiClient, get_client
+from Change_Detection import DiffWriter, SkuSnapshot, add_incremental_arguments, open_diff_output, plan_fetch
+from Circuit_Breaker import add_breaker_arguments, configure_breakers
+from Deadlines import RUN_DEADLINE, TIMED_OUT, add_timeout_arguments, failure_status, start_run_deadline, timeouts_from_args
+from Field_Mapping import Derived, Literal, RowSchema, response_json
+from Hedging import add_hedging_arguments, configure_hedging
+from Input_Reader import add_input_arguments, read_column, row_count
+from Output_Writer import StreamingExcelWriter, add_output_arguments, highlight_fill, open_output_writer
+from Response_Cache import add_cache_arguments, cache_from_args
+from Run_Log import Progress, add_logging_arguments, get_logger, logging_from_args
+from Run_Metrics import add_metrics_arguments, reporter_from_args
+from Run_Journal import RunJournal, journal_path_for
+
+log = get_logger("pdp")
+
+BATCH_SEPARATOR = ","
+
+# Normalize a SKU read from the input sheet
+def normalize_sku(url):
+    if isinstance(url, float):  
+        return str(int(url))  # Remove decimal part and convert to string  
+    return str(url).lower()  # Con
+
+# Endpoint and query parameters for a single SKU request
+def sku_request(isapi, rootdomain, url):
+    if isapi:
+        return "apiextraction", {"rootdomain": rootdomain, "skus": url}
+    return "extraction", {"rootdomain": rootdomain, "sku": url}
 
 # Function to fetch data from a URL
-def get_data_from_url(timeout,isapi,rootdomain,url):
+def get_data_from_url(timeout,isapi,rootdomain,url,client=None):
+    client = client or get_client()
     try:
-        if isinstance(url, float):  
-            url = str(int(url))  # Remove decimal part and convert to string  
-        else:  
-            url = str(url).lower()  # Con
-        response=""
-        if isapi:
-            response = requests.get(f"http://localhost:5000/api/apiextraction?rootdomain={rootdomain}&skus={url}", timeout=timeout)
-            count = 1
-
-            if response.status_code != 200:
-                response = requests.get(f"http://localhost:5000/api/apiextraction?rootdomain={rootdomain}&skus={url}", timeout=timeout*2)
-                count += 1
-
-            if response.status_code != 200:
-                response = requests.get(f"http://localhost:5000/api/apiextraction?rootdomain={rootdomain}&skus={url}", timeout=timeout*3)
-                count += 1
-        else:
-            response = requests.get(f"http://localhost:5000/api/extraction/sku?rootdomain={rootdomain}&sku={url}", timeout=timeout)
-            count = 1
-
-            if response.status_code != 200:
-                response = requests.get(f"http://localhost:5000/api/extraction/sku?rootdomain={rootdomain}&sku={url}", timeout=timeout*2)
-                count += 1
-
-            if response.status_code != 200:
-                response = requests.get(f"http://localhost:5000/api/extraction/sku?rootdomain={rootdomain}&sku={url}", timeout=timeout*3)
-                count += 1
-
-        if response.status_code != 200:
-            print(f"{url} not worked after {count} attempts")
-            return {"status_code": response.status_code, "error": f"Failed after {count} attempts", "sku": url,}
-        if response.status_code == 200:
-            data = response.json()
-            print(f"{url} worked after {count} attempts")
-
-            sellerSku=""
-            if isapi:
-                sellerSku=data.get("sellerSkus", {})[0]
-            else:
-                sellerSku = data.get("sellerSku", {})
-            skuEntry = sellerSku.get("skuEntry", {})
-            skuImages = skuEntry.get("skuImages", {})
-            shipping_options = skuEntry.get("shippingOptions", [])
-
-            image_urls = [
-                skuImages.get(f'productImageUrl{i}') for i in range(1, 11)
-            ]
-
-            # Check if all image URLs start with "http" or "https"
-            images_start_with_http = all(url is None or str(url).startswith("http") for url in image_urls)
-
-            return {
-                "status_code": response.status_code,
-                "price_skuSeller": sellerSku.get("price"),  # Price from skuSeller
-                "price_skuEntry": skuEntry.get("price"),  # Price from skuEntry
-                "price": sellerSku.get("price") or skuEntry.get("price"),
-                "condition": sellerSku.get("condition"),
-                "source": sellerSku.get("source"),
-                "sku": skuEntry.get("sku"),
-                "url": skuEntry.get("url"),
-                "name": skuEntry.get("name"),
-                "brand": skuEntry.get("brand"),
-                "description": skuEntry.get("description"),
-                "features": skuEntry.get("features"),
-                "upc": skuEntry.get("upc"),
-                "ean": skuEntry.get("ean"),
-                "mpn": skuEntry.get("mpn"),
-                "item_number": skuEntry.get("itemNumber"),
-                "store_sku": skuEntry.get("storeSku"),
-                "store_name": skuEntry.get("storeName"),
-                "availability": skuEntry.get("availability"),
-                "category": skuEntry.get("category"),
-                "attributes": skuEntry.get("attributes"),
-                "star_rating_distribution": skuEntry.get("starRatingDistribution"),
-                "average_customer_review": skuEntry.get("averageCustomerReview"),
-                "number_of_customer_reviews": skuEntry.get("numberOfCustomerReviews"),
-                "variants": skuEntry.get("variants"),
-                "parent_sku": skuEntry.get("parentSku"),
-                "seller_name": skuEntry.get("sellerName"),
-                "seller_id": sellerSku.get("skuEntry", {}).get("buyBoxWinnerHistory"),
-                "quantity_sold": skuEntry.get("quantitySold"),
-                "quantity_sold_7d": skuEntry.get("quantitySold7D"),
-                "variant_attributes": skuEntry.get("variantAttributes"),
-                "number_of_favorites": skuEntry.get("numberOfFavorites"),
-                "deal_type": skuEntry.get("dealType"),
-                "deal_text": skuEntry.get("dealText"),
-                "promo_text": skuEntry.get("promoText"),
-                "list_price": skuEntry.get("listPrice"),
-                "numberOfPayments" : skuEntry.get('numberOfPayments'),
-                "pricePerPayments": skuEntry.get('pricePerPayments'),
-                'totalPaymentsPrice': skuEntry.get('totalPaymentsPrice'),
-                "productImageUrl1": skuImages.get('productImageUrl1'),
-                "productImageUrl2": skuImages.get('productImageUrl2'),
-                "productImageUrl3": skuImages.get('productImageUrl3'),
-                "productImageUrl4": skuImages.get('productImageUrl4'),
-                "productImageUrl5": skuImages.get('productImageUrl5'),
-                "productImageUrl6": skuImages.get('productImageUrl6'),
-                "productImageUrl7": skuImages.get('productImageUrl7'),
-                "productImageUrl8": skuImages.get('productImageUrl8'),
-                "productImageUrl9": skuImages.get('productImageUrl9'),
-                "productImageUrl10": skuImages.get('productImageUrl10'),
-                "Images_starts_with_http": images_start_with_http,
-                "product_Image_match": skuImages.get('productImageUrl1') == skuImages.get('productImageUrl2') == skuImages.get('productImageUrl3') ==skuImages.get('productImageUrl4') == skuImages.get('productImageUrl5') == skuImages.get('productImageUrl6') == skuImages.get('productImageUrl7') == skuImages.get('productImageUrl8') == skuImages.get('productImageUrl9') == skuImages.get('productImageUrl10'),
-                "used_price": skuEntry.get("usedPrice"),
-                "model": skuEntry.get("model"),
-                "image_count": skuEntry.get("imageCount"),
-                "video_count": skuEntry.get("videoCount"),
-                "document_count": skuEntry.get("documentCount"),
-                "isSponsored": skuEntry.get("isSponsored"),
-                "coupon_absolute_discount": skuEntry.get("couponAbsoluteDiscount"),
-                "coupon_percent_discount": skuEntry.get("couponPercentDiscount"),
-                "panorama_count": skuEntry.get("panoramaCount"),
-                "is_aplus": skuEntry.get("isAPlus"),
-                "aplus_premium": skuEntry.get("aplusPremium"),
-                "aplus_comparison": skuEntry.get("aplusComparison"),
-                "aplus_faq": skuEntry.get("aplusFaq"),
-                "aplus_video": skuEntry.get("aplusVideo"),
-                "flash_sale_end_time": skuEntry.get("flashSaleEndTime"),
-                "is_official_seller": skuEntry.get("isOfficialSeller"),
-                "price_by_unit": skuEntry.get("priceByUnit"),
-                "price_per_unit": skuEntry.get("pricePerUnit"),
-                "currency": skuEntry.get("currency"),
-                "uvp": skuEntry.get("uvp"),
-                "shipping_options": shipping_options,
-                "process_name": "cds",
-                "timestamp": datetime.datetime.now().isoformat(),
-                "rootdomain": skuEntry.get("rootDomain"),
-                "preorder": "",
-                "category_l1": skuEntry.get("categoryLvl1"),
-                "category_l2": skuEntry.get("categoryLvl2"),
-                "category_l3": skuEntry.get("categoryLvl3"),
-                "category_l4": skuEntry.get("categoryLvl4"),
-                "category_l5": skuEntry.get("categoryLvl5"),
-                "category_l6": skuEntry.get("categoryLvl6"),
-                "category_l7": skuEntry.get("categoryLvl7"),
-                "category_l8": skuEntry.get("categoryLvl8"),
-                "category_l9": skuEntry.get("categoryLvl9"),
-                "category_l10": skuEntry.get("categoryLvl10"),
-                "normalized_attributes": "",
-                "title_attributes": "",
-                "tagged_name": "",
-                "number_of_customer_ratings": skuEntry.get("numberOfCustomerRatings"),
-                "redirected_sku": skuEntry.get("redirectedSku"),
-            }
-        else:
-            return None
+        url = normalize_sku(url)
+        endpoint, params = sku_request(isapi, rootdomain, url)
+        response, count = client.request(endpoint, timeout, **params)
+
+        return build_result(response, count, isapi, url)
     except requests.RequestException as e:
-        print(f"Error fetching data from {url}: {e}")
-        return None
+        log.debug("Error fetching data from %s: %s", url, e, extra={"sku": url, "error": str(e)})
+        return PDP_SCHEMA.blank(status_code=failure_status(e), error=str(e), sku=url)
+
+# Asyncio engine counterpart of get_data_from_url
+async def get_data_from_url_async(timeout,isapi,rootdomain,url,client):
+    try:
+        url = normalize_sku(url)
+        endpoint, params = sku_request(isapi, rootdomain, url)
+        response, count = await client.request(endpoint, timeout, **params)
 
-# Function to read URLs from the Excel file
-def read_urls_from_excel(file_path, column_name='sku'):
-    df = pd.read_excel(file_path)
-    return df[column_name].tolist()
+        return build_result(response, count, isapi, url)
+    except requests.RequestException as e:
+        log.debug("Error fetching data from %s: %s", url, e, extra={"sku": url, "error": str(e)})
+        return PDP_SCHEMA.blank(status_code=failure_status(e), error=str(e), sku=url)
+
+# Turn an extractor response into a result row, shared by both engines
+def build_result(response, count, isapi, url):
+    if response.status_code != 200:
+        log.debug("%s not worked after %s attempts", url, count, extra={"sku": url, "status": response.status_code, "attempts": count})
+        return PDP_SCHEMA.blank(status_code=response.status_code, error=f"Failed after {count} attempts", sku=url)
+    data = response_json(response)
+    log.debug("%s worked after %s attempts", url, count, extra={"sku": url, "status": 200, "attempts": count})
+
+    sellerSku=""
+    if isapi:
+        sellerSku=data.get("sellerSkus", {})[0]
+    else:
+        sellerSku = data.get("sellerSku", {})
+    return parse_seller_sku(sellerSku, response.status_code)
+
+IMAGE_COLUMNS = ["productImageUrl1", "productImageUrl2", "productImageUrl3", "productImageUrl4", "productImageUrl5",
+                 "productImageUrl6", "productImageUrl7", "productImageUrl8", "productImageUrl9", "productImageUrl10"]
+
+image_urls = itemgetter(*IMAGE_COLUMNS)
+
+# Check if all image URLs start with "http" or "https"
+def images_start_with_http(row):
+    return all(url is None or str(url).startswith("http") for url in image_urls(row))
+
+def product_image_match(row):
+    urls = image_urls(row)
+    return urls.count(urls[0]) == len(urls)
+
+def timestamp(source):
+    return datetime.datetime.now().isoformat()
+
+# Output columns of a PDP row, in sheet order, mapped to paths inside one sellerSku entry
+PDP_SCHEMA = RowSchema([
+    ("status_code", None),
+    ("error", None),
+    ("price", lambda sellerSku: sellerSku.get("price") or (sellerSku.get("skuEntry") or {}).get("price")),
+    ("condition", "condition"),
+    ("source", "source"),
+    ("sku", "skuEntry.sku"),
+    ("url", "skuEntry.url"),
+    ("name", "skuEntry.name"),
+    ("brand", "skuEntry.brand"),
+    ("description", "skuEntry.description"),
+    ("features", "skuEntry.features"),
+    ("upc", "skuEntry.upc"),
+    ("ean", "skuEntry.ean"),
+    ("mpn", "skuEntry.mpn"),
+    ("item_number", "skuEntry.itemNumber"),
+    ("store_sku", "skuEntry.storeSku"),
+    ("store_name", "skuEntry.storeName"),
+    ("availability", "skuEntry.availability"),
+    ("category", "skuEntry.category"),
+    ("attributes", "skuEntry.attributes"),
+    ("star_rating_distribution", "skuEntry.starRatingDistribution"),
+    ("average_customer_review", "skuEntry.averageCustomerReview"),
+    ("number_of_customer_reviews", "skuEntry.numberOfCustomerReviews"),
+    ("variants", "skuEntry.variants"),
+    ("parent_sku", "skuEntry.parentSku"),
+    ("seller_name", "skuEntry.sellerName"),
+    ("seller_id", "skuEntry.buyBoxWinnerHistory"),
+    ("quantity_sold", "skuEntry.quantitySold"),
+    ("quantity_sold_7d", "skuEntry.quantitySold7D"),
+    ("variant_attributes", "skuEntry.variantAttributes"),
+    ("number_of_favorites", "skuEntry.numberOfFavorites"),
+    ("deal_type", "skuEntry.dealType"),
+    ("deal_text", "skuEntry.dealText"),
+    ("promo_text", "skuEntry.promoText"),
+    ("list_price", "skuEntry.listPrice"),
+    ("numberOfPayments", "skuEntry.numberOfPayments"),
+    ("pricePerPayments", "skuEntry.pricePerPayments"),
+    ("totalPaymentsPrice", "skuEntry.totalPaymentsPrice"),
+    *[(column, f"skuEntry.skuImages.{column}") for column in IMAGE_COLUMNS],
+    ("Images_starts_with_http", Derived(images_start_with_http)),
+    ("product_Image_match", Derived(product_image_match)),
+    ("used_price", "skuEntry.usedPrice"),
+    ("model", "skuEntry.model"),
+    ("image_count", "skuEntry.imageCount"),
+    ("video_count", "skuEntry.videoCount"),
+    ("document_count", "skuEntry.documentCount"),
+    ("isSponsored", "skuEntry.isSponsored"),
+    ("coupon_absolute_discount", "skuEntry.couponAbsoluteDiscount"),
+    ("coupon_percent_discount", "skuEntry.couponPercentDiscount"),
+    ("panorama_count", "skuEntry.panoramaCount"),
+    ("is_aplus", "skuEntry.isAPlus"),
+    ("aplus_premium", "skuEntry.aplusPremium"),
+    ("aplus_comparison", "skuEntry.aplusComparison"),
+    ("aplus_faq", "skuEntry.aplusFaq"),
+    ("aplus_video", "skuEntry.aplusVideo"),
+    ("flash_sale_end_time", "skuEntry.flashSaleEndTime"),
+    ("is_official_seller", "skuEntry.isOfficialSeller"),
+    ("price_by_unit", "skuEntry.priceByUnit"),
+    ("price_per_unit", "skuEntry.pricePerUnit"),
+    ("currency", "skuEntry.currency"),
+    ("uvp", "skuEntry.uvp"),
+    ("shipping_options", lambda sellerSku: (sellerSku.get("skuEntry") or {}).get("shippingOptions", [])),
+    ("process_name", Literal("cds")),
+    ("timestamp", timestamp),
+    ("rootdomain", "skuEntry.rootDomain"),
+    ("preorder", Literal("")),
+    *[(f"category_l{level}", f"skuEntry.categoryLvl{level}") for level in range(1, 11)],
+    ("normalized_attributes", Literal("")),
+    ("title_attributes", Literal("")),
+    ("tagged_name", Literal("")),
+    ("number_of_customer_ratings", "skuEntry.numberOfCustomerRatings"),
+    ("redirected_sku", "skuEntry.redirectedSku"),
+], compact=True, name="PdpRow", intern=[
+    "condition", "source", "brand", "store_name", "availability", "category", "seller_name", "deal_type", "currency", "rootdomain",
+    *[f"category_l{level}" for level in range(1, 11)],
+])
+
+# Build the output row for one sellerSku entry of an extractor response
+def parse_seller_sku(sellerSku, status_code):
+    return PDP_SCHEMA.build(sellerSku, status_code=status_code)
+
+# Split the input SKUs into groups of batch_size for /api/apiextraction
+def make_batches(urls, batch_size):
+    return [urls[index:index + batch_size] for index in range(0, len(urls), batch_size)]
+
+# Batches of distinct SKUs plus how often each was listed, so a repeated SKU costs one request and
+# its row is written once per listing. The copies are only known once the whole input has been read,
+# so batch mode reads the SKU list up front.
+def make_unique_batches(urls, batch_size):
+    copies = Counter(normalize_sku(url) for url in urls)
+    return make_batches(list(copies), batch_size), copies
+
+# Identifiers a sellerSku of a batch response can be matched on: its sku and the last part of its url
+def batch_identifiers(sellerSku):
+    entry = sellerSku.get("skuEntry") or {}
+    identifiers = [str(entry.get("sku") or "").lower(), str(entry.get("url") or "").rstrip("/").rsplit("/", 1)[-1].lower()]
+    return [identifier for identifier in identifiers if identifier]
+
+# Match the sellerSkus of a batch response to the requested SKUs that are still missing, by identifier
+# only. Returns the SKUs still missing and whether the response held sellerSkus that matched none of
+# them (the service rewrote their SKUs): asking for those SKUs in a batch again cannot match them either.
+def merge_batch_response(response, pending, results):
+    sellerSkus = [sellerSku for sellerSku in response_json(response).get("sellerSkus") or [] if sellerSku]
+    unmatched = False
+    for sellerSku in sellerSkus:
+        sku = next((identifier for identifier in batch_identifiers(sellerSku) if identifier in pending and identifier not in results), None)
+        if sku is None:
+            unmatched = True
+        else:
+            results[sku] = parse_seller_sku(sellerSku, response.status_code)
+    return [url for url in pending if url not in results], unmatched
+
+def batch_failure_rows(urls, pending, results, status_code, count):
+    for url in pending:
+        log.debug("%s not worked after %s attempts", url, count, extra={"sku": url, "status": status_code, "attempts": count})
+        results[url] = PDP_SCHEMA.blank(status_code=status_code, error=f"Failed after {count} attempts", sku=url)
+    return [results[url] for url in urls]
+
+# Fetch several SKUs with one /api/apiextraction call; later attempts only ask for the SKUs still missing
+def get_batch_data_from_urls(timeout,rootdomain,urls,client=None):
+    client = client or get_client()
+    urls = [normalize_sku(url) for url in urls]
+    pending = list(dict.fromkeys(urls))
+    results = {}
+    status_code = None
+    count = 0
+    rounds = 0
+    # Transport retries happen inside client.request; this loop only re-requests SKUs missing from a 200 response
+    while pending and rounds < client.retry_policy.max_attempts:
+        if rounds and not client.retry_policy.wait_before_retry(rounds):
+            break
+        rounds += 1
+        try:
+            response, attempts = client.request("apiextraction", timeout, coalesce=rounds == 1, rootdomain=rootdomain, skus=BATCH_SEPARATOR.join(pending))
+        except requests.RequestException as e:
+            log.debug("Error fetching batch of %s SKUs: %s", len(pending), e, extra={"skus": pending, "error": str(e)})
+            status_code = failure_status(e)
+            count += 1
+            break
+        count += attempts
+        status_code = response.status_code
+        if status_code != 200:
+            break
+        pending, unmatched = merge_batch_response(response, pending, results)
+        if unmatched:
+            break
+    log.debug("Batch of %s SKUs: %s worked after %s attempts", len(urls), len(urls) - len(pending), count,
+              extra={"skus": urls, "failed": pending, "attempts": count})
+    # SKUs the batch answered without a matching row are fetched one by one
+    if pending and status_code == 200:
+        for url in pending:
+            results[url] = get_data_from_url(timeout, True, rootdomain, url, client)
+        pending = []
+    return batch_failure_rows(urls, pending, results, status_code, count)
+
+# Asyncio engine counterpart of get_batch_data_from_urls
+async def get_batch_data_from_urls_async(timeout,rootdomain,urls,client):
+    urls = [normalize_sku(url) for url in urls]
+    pending = list(dict.fromkeys(urls))
+    results = {}
+    status_code = None
+    count = 0
+    rounds = 0
+    # Transport retries happen inside client.request; this loop only re-requests SKUs missing from a 200 response
+    while pending and rounds < client.retry_policy.max_attempts:
+        if rounds and not await client.retry_policy.wait_before_retry_async(rounds):
+            break
+        rounds += 1
+        try:
+            response, attempts = await client.request("apiextraction", timeout, coalesce=rounds == 1, rootdomain=rootdomain, skus=BATCH_SEPARATOR.join(pending))
+        except requests.RequestException as e:
+            log.debug("Error fetching batch of %s SKUs: %s", len(pending), e, extra={"skus": pending, "error": str(e)})
+            status_code = failure_status(e)
+            count += 1
+            break
+        count += attempts
+        status_code = response.status_code
+        if status_code != 200:
+            break
+        pending, unmatched = merge_batch_response(response, pending, results)
+        if unmatched:
+            break
+    log.debug("Batch of %s SKUs: %s worked after %s attempts", len(urls), len(urls) - len(pending), count,
+              extra={"skus": urls, "failed": pending, "attempts": count})
+    # SKUs the batch answered without a matching row are fetched one by one
+    if pending and status_code == 200:
+        rows = await asyncio.gather(*(get_data_from_url_async(timeout, True, rootdomain, url, client) for url in pending))
+        results.update(zip(pending, rows))
+        pending = []
+    return batch_failure_rows(urls, pending, results, status_code, count)
+
+# SKUs from the input file (xlsx, csv, jsonl, parquet or - for stdin), read lazily as the run goes
+def read_urls(file_path, column_name='sku'):
+    return read_column(file_path, column_name)
+
+# Define headers
+HEADERS = PDP_SCHEMA.columns
+
+def is_invalid_image_url(value):
+    return bool(value) and not str(value).startswith("http")
+
+# Attributes are checked on the parsed dict; a JSON string is decoded rather than eval'd
+def has_empty_attribute(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return False
+    return isinstance(value, dict) and any(item in [None, ""] for item in value.values())
+
+# Cell rules applied on top of the blank-cell check: (columns, predicate on the parsed value)
+HIGHLIGHT_RULES = [
+    (["product_Image_match"], lambda value: value == True),
+    (["Images_starts_with_http"], lambda value: value == False),
+    (["availability", "condition"], lambda value: value not in [1, "1"]),
+    (["attributes"], has_empty_attribute),
+    (IMAGE_COLUMNS, is_invalid_image_url),
+]
+COMPILED_HIGHLIGHT_RULES = [(column, rule) for columns, rule in HIGHLIGHT_RULES for column in columns]
+
+# Decide the highlighted cells of one output row in a single pass over the parsed values
+def pdp_row_fills(data, values):
+    fills = {header: highlight_fill for header, value in zip(HEADERS, values) if value is None or value == ""}
+    for column, rule in COMPILED_HIGHLIGHT_RULES:
+        if rule(data.get(column, "")):
+            fills[column] = highlight_fill
+    return fills
+
+# Streaming writer for PDP rows: each row is styled as it is appended
+def open_excel_writer(output_file):
+    return StreamingExcelWriter(output_file, HEADERS, "Extracted Data", row_fills=pdp_row_fills,
+                                same_value_ignore=[None, "", False,"False",0,"0","Unknown","unknown"],
+                                highlight_blank_columns=True, write_empty=True)
+
+# PDP rows in the chosen output format; with another format the highlighted workbook is an optional sample report
+def open_output(output_file, output_format="xlsx", report_rows=0):
+    return open_output_writer(output_file, HEADERS, open_excel_writer, output_format, report_rows, write_empty=True)
 
 # Function to write data to a new Excel file and highlight empty columns
 def write_data_to_excel(output_file, data_list):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Extracted Data"
-
-    # Define headers
-    headers = ["status_code","error",
-        "price", "condition","source","sku", "url", "name", "brand", "description", "features",
-        "upc", "ean", "mpn", "item_number", "store_sku","store_name", "availability", "category",
-        "attributes","star_rating_distribution", "average_customer_review", "number_of_customer_reviews", "variants",
-        "parent_sku", "seller_name", "seller_id", "quantity_sold",
-        "quantity_sold_7d", "variant_attributes", "number_of_favorites", "deal_type",
-        "deal_text", "promo_text", "list_price","numberOfPayments", "pricePerPayments","totalPaymentsPrice",
-        "productImageUrl1","productImageUrl2","productImageUrl3","productImageUrl4","productImageUrl5","productImageUrl6",
-        "productImageUrl7","productImageUrl8","productImageUrl9","productImageUrl10","Images_starts_with_http","product_Image_match","used_price","model",
-        "image_count", "video_count","document_count","isSponsored", "coupon_absolute_discount", "coupon_percent_discount", "panorama_count",
-        "is_aplus", "aplus_premium", "aplus_comparison", "aplus_faq", "aplus_video",
-        "flash_sale_end_time", "is_official_seller", "price_by_unit", "price_per_unit",
-        "currency", "uvp", "shipping_options", "process_name", "timestamp", "rootdomain",
-        "preorder", "category_l1", "category_l2", "category_l3", "category_l4", "category_l5",
-        "category_l6", "category_l7", "category_l8", "category_l9", "category_l10",
-        "normalized_attributes", "title_attributes", "tagged_name", "number_of_customer_ratings",
-        "redirected_sku"
-    ]
-    ws.append(headers)
-
-    for data in data_list:
-        row = []
-        for field in headers:
-            value = data.get(field, "")
-
-            # Convert lists or dictionaries to strings
-            if isinstance(value, (list, dict)):
-                value = str(value)
-
-            row.append(value)
-        ws.append(row)
-
-
-    # Load workbook for formatting
-    wb.save(output_file)
-    wb = load_workbook(output_file)
-    ws = wb.active
-
-    # Identify and highlight empty columns
-    highlight_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-    red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-
-    for col_idx, header in enumerate(headers, start=1):
-        column_values = [ws.cell(row=row_idx, column=col_idx).value for row_idx in range(2, ws.max_row + 1)]
-    
-        # Remove None values to avoid false matches
-        non_empty_values = [val for val in column_values if val not in [None, "", False,"False",0,"0","Unknown","unknown"]]
-
-        if len(set(non_empty_values)) == 1 and len(non_empty_values) > 0:  # Check if all values are the same
-            ws.cell(row=1, column=col_idx).fill = red_fill  # Highlight header in red
-
-    for col_idx, header in enumerate(headers, start=1):
-        is_column_blank = True
-        for row_idx in range(2, ws.max_row + 1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            if cell.value not in [None, ""]:
-                is_column_blank = False
-            elif header in headers:
-                cell.fill = highlight_fill
-        if is_column_blank:
-            ws.cell(row=1, column=col_idx).fill = highlight_fill
-
-        for row_idx in range(2, ws.max_row + 1):
-            product_Image_match_cell = ws.cell(row=row_idx, column=headers.index("product_Image_match") + 1)
-            if product_Image_match_cell.value == True:
-                product_Image_match_cell.fill = highlight_fill
-
-        for row_idx in range(2, ws.max_row + 1):
-            http_Image_match_cell = ws.cell(row=row_idx, column=headers.index("Images_starts_with_http") + 1)
-            if http_Image_match_cell.value == False:
-                http_Image_match_cell.fill = highlight_fill
-
-        for row_idx in range(2, ws.max_row + 1):
-            availability_cell = ws.cell(row=row_idx, column=headers.index("availability") + 1)
-            if availability_cell.value not in [1,"1"]:
-                availability_cell.fill = highlight_fill
-
-        for row_idx in range(2, ws.max_row + 1):
-            condition_col_idx = headers.index("condition") + 1  # Find the column index for "condition"
-            condition_cell = ws.cell(row=row_idx, column=condition_col_idx)
-            
-            if condition_cell.value not in [1, "1"]:  # Check if the value is not 1
-                condition_cell.fill = highlight_fill  # Highlight the cell
-        
-        for row_idx in range(2, ws.max_row + 1):
-            attributes_cell = ws.cell(row=row_idx, column=headers.index("attributes") + 1)
-            if isinstance(attributes_cell.value, str):  # Ensuring it's a string (from JSON conversion)
-                try:
-                    attributes_dict = eval(attributes_cell.value)  # Convert string back to dictionary
-                    if isinstance(attributes_dict, dict):
-                        for key, value in attributes_dict.items():
-                            if value in [None, ""]:  # If any key-value pair is null or empty
-                                attributes_cell.fill = highlight_fill
-                                break  # Highlight once and stop checking further
-                except:
-                    pass  # Ignore any conversion errors
-
-        for row_idx in range(2, ws.max_row + 1):
-            for img_col in ["productImageUrl1", "productImageUrl2", "productImageUrl3", "productImageUrl4", "productImageUrl5",
-                            "productImageUrl6", "productImageUrl7", "productImageUrl8", "productImageUrl9", "productImageUrl10"]:
-                col_idx = headers.index(img_col) + 1  # Find the column index
-                cell = ws.cell(row=row_idx, column=col_idx)
-                if cell.value and not str(cell.value).startswith("http" or "https"):  # Check if URL is invalid
-                    cell.fill = highlight_fill  # Highlight the cell
-
-
-    wb.save(output_file)
-    # wb.save(output_file)
-# Main function
-def main(timeout,isapi,rootdomain,workers,input_file, output_file):
-    urls = read_urls_from_excel(input_file)
-    extracted_data = []
-
+    writer = open_excel_writer(output_file)
+    writer.extend(data_list)
+    writer.close()
+
+# Units (SKUs or batches) submitted per worker: the engines read the input only this far ahead of the
+# requests in flight, so fetching starts on the first SKU and a huge input is never held as futures
+SUBMIT_AHEAD = 2
+
+# Result for a unit (a SKU or a batch) that was cancelled or never started when the run deadline passed
+def timed_out_result(url):
+    error = str(RUN_DEADLINE.exceeded())
+    if isinstance(url, list):
+        return [PDP_SCHEMA.blank(status_code=TIMED_OUT, error=error, sku=normalize_sku(sku)) for sku in url]
+    return PDP_SCHEMA.blank(status_code=TIMED_OUT, error=error, sku=normalize_sku(url))
+
+# Once the run deadline passes, units not started yet are cancelled and the rest of the input is not
+# fetched; all of them are written (and journaled as failed) as timed-out rows, so a resumed run picks them up
+def time_out_units(writer, journal, units, copies, progress):
+    count = 0
+    for url in units:
+        collect_result(writer, journal, url, timed_out_result(url), copies, progress)
+        count += 1
+    if count:
+        log.warning(f"{RUN_DEADLINE.exceeded()}: {count} units written as timed out")
+
+# Thread engine: one pool thread per in-flight SKU or batch
+def run_thread_engine(timeout,isapi,rootdomain,workers,urls,writer,journal=None,batch_size=1,cache=None,progress=None):
+    client = get_client(workers, cache)
+    client.new_run()
+
+    batched = isapi and batch_size > 1
+    units, copies = make_unique_batches(urls, batch_size) if batched else (urls, None)
+    units = iter(units)
     with ThreadPoolExecutor(max_workers=workers) as executor:
-        future_to_url = {executor.submit(get_data_from_url,timeout,isapi,rootdomain, url): url for url in urls}
-        for future in as_completed(future_to_url):
-            url = future_to_url[future]
-            try:
-                result = future.result()
-                if result:
-                    extracted_data.append(result)
+        future_to_url = {}
+
+        def submit(count):
+            for url in itertools.islice(units, count):
+                if batched:
+                    future_to_url[executor.submit(get_batch_data_from_urls,timeout,rootdomain, url, client)] = url
+                else:
+                    future_to_url[executor.submit(get_data_from_url,timeout,isapi,rootdomain, url, client)] = url
+
+        submit(workers * SUBMIT_AHEAD)
+        while future_to_url:
+            remaining = None if RUN_DEADLINE.expired() else RUN_DEADLINE.remaining()
+            done, _ = wait(future_to_url, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                # Drop finished futures so their rows can be freed once written
+                url = future_to_url.pop(future)
+                try:
+                    collect_result(writer, journal, url, future.result(), copies, progress)
+                except Exception as e:
+                    log.error("Error processing %s: %s", url, e, exc_info=True)
+                    failed_unit(progress, url)
+            if RUN_DEADLINE.expired():
+                # Running units finish on their own: their requests are cut to the deadline
+                cancelled = [future for future in future_to_url if future.cancel()]
+                time_out_units(writer, journal, [future_to_url.pop(future) for future in cancelled], copies, progress)
+            else:
+                submit(len(done))
+    time_out_units(writer, journal, units, copies, progress)
+
+    client.log_concurrency()
+    log.info(client.coalescer.summary())
+
+# Asyncio engine: a single event loop with at most `workers` requests in flight
+def run_async_engine(timeout,isapi,rootdomain,workers,urls,writer,journal=None,batch_size=1,cache=None,progress=None):
+    async def fetch(client, url):
+        try:
+            if isapi and batch_size > 1:
+                return url, await get_batch_data_from_urls_async(timeout,rootdomain,url,client), None
+            return url, await get_data_from_url_async(timeout,isapi,rootdomain,url,client), None
+        except Exception as e:
+            return url, None, e
+
+    async def run():
+        units, copies = make_unique_batches(urls, batch_size) if isapi and batch_size > 1 else (urls, None)
+        units = iter(units)
+        async with AsyncApiClient(concurrency=workers, cache=cache) as client:
+            client.new_run()
+            tasks = {}
+
+            def submit(count):
+                for url in itertools.islice(units, count):
+                    tasks[asyncio.ensure_future(fetch(client, url))] = url
+
+            def collect(task):
+                url, result, error = task.result()
+                if error is not None:
+                    log.error("Error processing %s: %s", url, error, exc_info=error)
+                    failed_unit(progress, url)
                 else:
-                    print(f"No data for {url}")
-            except Exception as e:
-                print(f"Error processing {url}: {e}")
+                    collect_result(writer, journal, url, result, copies, progress)
+
+            submit(workers * SUBMIT_AHEAD)
+            while tasks:
+                done, _ = await asyncio.wait(tasks, timeout=RUN_DEADLINE.remaining(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.pop(task)
+                    collect(task)
+                if RUN_DEADLINE.expired():
+                    # Unlike threads, tasks in flight can be cancelled outright
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    for task in [task for task in tasks if not task.cancelled()]:
+                        tasks.pop(task)
+                        collect(task)
+                    time_out_units(writer, journal, list(tasks.values()), copies, progress)
+                    tasks.clear()
+                else:
+                    submit(len(done))
+            time_out_units(writer, journal, units, copies, progress)
+            client.log_concurrency()
+            log.info(client.coalescer.summary())
+
+    asyncio.run(run())
+
+# Batches return one row per requested SKU, single requests return one row.
+# Every row is journaled (and, in an incremental run, diffed) under its input SKU before it is written; copies (from make_unique_batches)
+# repeats a batch row for each time its SKU was listed.
+def collect_result(writer, journal, url, result, copies=None, progress=None):
+    if isinstance(result, list):
+        skus = [normalize_sku(sku) for sku in url]
+        rows = result
+    elif result:
+        skus = [normalize_sku(url)]
+        rows = [result]
+    else:
+        log.debug("No data for %s", url, extra={"sku": url})
+        failed_unit(progress, url)
+        return
+    for sku, row in zip(skus, rows):
+        ok = row.get("status_code") == 200
+        for _ in range(copies[sku] if copies else 1):
+            if journal is not None:
+                journal.record("pdp", sku, [row], ok=ok)
+            if isinstance(writer, DiffWriter):
+                writer.append(row, sku)
+            else:
+                writer.append(row)
+            if progress is not None:
+                progress.advance(failed=not ok)
+
+# Count every input SKU of a unit (a SKU or a batch of them) that produced no row as done and failed
+def failed_unit(progress, url):
+    if progress is not None:
+        units = url if isinstance(url, list) else [url]
+        progress.advance(len(units), failed=len(units))
+
+# Input SKUs still to fetch, lazily: a SKU listed n times with m journaled rows is fetched n - m more times
+def remaining_urls(urls, completions):
+    completions = dict(completions)
+    for url in urls:
+        sku = normalize_sku(url)
+        if completions.get(sku, 0) > 0:
+            completions[sku] -= 1
+        else:
+            yield url
+
+ENGINES = {
+    "thread": run_thread_engine,
+    "async": run_async_engine,
+}
+
+# Columns that make up a SKU's content for change detection; status, error and timestamp change every run
+TRACKED_COLUMNS = [column for column in HEADERS if column not in ("status_code", "error", "timestamp")]
+
+# Diff report next to the workbook, e.g. pdp_hp-com-us.xlsx -> pdp_hp-com-us_changes.xlsx
+def changes_file_for(output_file):
+    return output_file.replace(".xlsx", "_changes.xlsx")
+
+# Incremental run: only new, failed and stale SKUs (by the snapshot and the freshness policy) are fetched,
+# and instead of the full sheet a diff report lists what changed since the snapshot
+def run_incremental(timeout,isapi,rootdomain,workers,urls,output_file,engine,batch_size,cache,output_format,snapshot,max_age,refresh_fraction):
+    store = SkuSnapshot(snapshot)
+    to_fetch, counts = plan_fetch([normalize_sku(url) for url in urls], store.ages(rootdomain), max_age, refresh_fraction)
+    log.info("Incremental run: fetching " + ", ".join(f"{counts[reason]} {reason}" for reason in ("new", "failed", "stale", "refresh"))
+             + f" SKUs, skipping {counts['fresh']} fresh ones")
+    writer = DiffWriter(store, rootdomain, open_diff_output(changes_file_for(output_file), output_format), TRACKED_COLUMNS,
+                        key=lambda row: normalize_sku(row.get("sku")))
+    with Progress("pdp", len(to_fetch)) as progress:
+        ENGINES[engine](timeout,isapi,rootdomain,workers,to_fetch,writer,None,batch_size,cache,progress)
+    if writer.close():
+        log.info(f"Changes saved to {writer.output_file}")
+    else:
+        log.info("No changes since the snapshot.")
+    log.info(f"Changes: {writer.summary()}")
 
-    write_data_to_excel(output_file, extracted_data)
+# Main function
+# With resume=True, SKUs already completed in the run journal are restored from it instead of fetched again.
+# cache is an optional Response_Cache.ResponseCache shared by repeated runs.
+# output_format picks xlsx, csv, jsonl or parquet; report_rows adds a highlighted workbook of the first rows.
+# snapshot (a SQLite path) switches to an incremental run; max_age (seconds) and refresh_fraction set its freshness policy.
+def main(timeout,isapi,rootdomain,workers,input_file, output_file, engine="thread", batch_size=1, resume=False, cache=None,
+         output_format="xlsx", report_rows=0, snapshot=None, max_age=24 * 3600, refresh_fraction=0.0):
+    urls = read_urls(input_file)
+    if snapshot is not None:
+        run_incremental(timeout,isapi,rootdomain,workers,urls,output_file,engine,batch_size,cache,output_format,snapshot,max_age,refresh_fraction)
+        if cache is not None:
+            log.info(cache.summary())
+        return
+    writer = open_output(output_file, output_format, report_rows)
+    # The input is streamed, so the SKU count comes from the file's metadata where it has any (an
+    # estimate: blank rows count too) and progress is open-ended otherwise
+    total = row_count(input_file)
+    with RunJournal(journal_path_for(output_file)) as journal:
+        if resume:
+            restored = journal.replay("pdp", writer)
+            urls = remaining_urls(urls, journal.completions("pdp"))
+            log.info(f"Resuming: {restored} SKUs restored from journal, fetching the rest")
+            if total is not None:
+                total = max(0, total - restored)
+        journal.open(resume)
+        with Progress("pdp", total) as progress:
+            ENGINES[engine](timeout,isapi,rootdomain,workers,urls,writer,journal,batch_size,cache,progress)
+    writer.close()
+    if RUN_DEADLINE.expired():
+        log.warning(f"{RUN_DEADLINE.exceeded()}: partial output saved to {writer.output_file}")
+    if cache is not None:
+        log.info(cache.summary())
 
 # Run the program
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="skip SKUs already in the run journal and rebuild the workbook from it")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="thread", help="async runs all SKUs on one event loop with the workers in flight")
+    parser.add_argument("--batch-size", type=int, default=1, help="SKUs per /api/apiextraction call")
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    add_output_arguments(parser)
+    add_logging_arguments(parser)
+    add_breaker_arguments(parser)
+    add_incremental_arguments(parser)
+    add_input_arguments(parser, default="Search_hp_com_us.xlsx")
+    add_timeout_arguments(parser)
+    add_hedging_arguments(parser)
+    args = parser.parse_args()
+    configure_breakers(args)
+    configure_hedging(args)
     rootdomain = "hp.com/us"
-    timeout=50000
-    workers=100
+    timeout=timeouts_from_args(args)  # Connect/read timeouts per attempt and a deadline per request across its retries
+    workers=100  # Ceiling; the adaptive limiter picks how many requests are in flight
     isapi=True
+    engine=args.engine  # "async" runs all SKUs on one event loop with `workers` requests in flight
+    batch_size=args.batch_size  # SKUs per /api/apiextraction call when isapi=True
     #input_excel = fr"Search_{rootdomain.replace('.','_').replace('/','_')}.xlsx"
-    input_excel=fr"Search_hp_com_us.xlsx"
-    output_excel = fr"pdp_{rootdomain.replace(".","-").replace("/","-")}.xlsx"
-    main(timeout,isapi,rootdomain,workers,input_excel, output_excel)
\ No newline at end of file
+    input_excel=args.input  # Search_hp_com_us.xlsx unless --input is given
+    output_excel = fr"pdp_{rootdomain.replace('.','-').replace('/','-')}.xlsx"
+    with logging_from_args(args), reporter_from_args(args):
+        start_run_deadline(args.deadline)
+        main(timeout,isapi,rootdomain,workers,input_excel, output_excel, engine, batch_size, args.resume, cache_from_args(args),
+             args.format, args.report_rows, args.snapshot, args.max_age * 3600, args.refresh_fraction)
@@ -0,0 +1,162 @@
+import argparse
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import PDP_Script
+import Reviews_Script
+import Search_Script
+from Api_Client import get_client
+from Circuit_Breaker import add_breaker_arguments, configure_breakers
+from Deadlines import RUN_DEADLINE, add_timeout_arguments, start_run_deadline, timeouts_from_args
+from Hedging import add_hedging_arguments, configure_hedging
+from Output_Writer import add_output_arguments
+from Response_Cache import add_cache_arguments, cache_from_args
+from Run_Log import Progress, add_logging_arguments, get_logger, logging_from_args
+from Run_Metrics import add_metrics_arguments, reporter_from_args
+
+log = get_logger("pipeline")
+
+# Marks the end of a stage's input
+END = object()
+
+# One pipeline stage: takes items from an inbox queue and runs work(item) on its own pool with at most
+# `workers` items in flight. emit(item, result) runs under a stage lock, so it can write to the stage's
+# workbook and hand items to the next stage; a full downstream queue blocks it and so slows this stage.
+class PipelineStage:
+    def __init__(self, name, workers, work, emit):
+        self.name = name
+        self.workers = workers
+        self.work = work
+        self.emit = emit
+        self.processed = 0
+        self._slots = threading.Semaphore(workers)
+        self._lock = threading.Lock()
+
+    def run(self, inbox):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                item = inbox.get()
+                if item is END:
+                    break
+                self._slots.acquire()
+                executor.submit(self._process, item)
+
+    def _process(self, item):
+        try:
+            result = self.work(item)
+            with self._lock:
+                self.emit(item, result)
+                self.processed += 1
+        except Exception as e:
+            log.error("%s: error processing %s: %s", self.name, item, e, exc_info=True)
+        finally:
+            self._slots.release()
+
+    def start(self, inbox, downstream=None):
+        def run():
+            try:
+                self.run(inbox)
+            finally:
+                if downstream is not None:
+                    downstream.put(END)
+        thread = threading.Thread(target=run, name=f"{self.name}-stage", daemon=True)
+        thread.start()
+        return thread
+
+# Search-side writer: rows go to the search workbook and each found SKU is queued for PDP extraction
+class SkuFeed:
+    def __init__(self, writer, outbox):
+        self.writer = writer
+        self.outbox = outbox
+        self.skus = 0
+
+    def extend(self, rows):
+        self.writer.extend(rows)
+        for row in rows:
+            if row.get("sku"):
+                self.outbox.put(row["sku"])
+                self.skus += 1
+
+# Search -> PDP -> Reviews with every stage running at once. SKUs move through bounded queues as soon as
+# their search page is released, so PDP extraction starts with the first page and reviews with the first
+# product, and each stage writes its own output file. queue_size bounds the hand-off queues.
+def main(workers, root, terms, max_pages, timeout, isapi=True, review_pages=4, retry_attempts=3, queue_size=1000, cache=None,
+         output_format="xlsx", report_rows=0):
+    slug = root.replace('.','_').replace('/','_')
+    search_writer = Search_Script.open_output(fr"Search_{slug}.xlsx", output_format, report_rows)
+    pdp_writer = PDP_Script.open_output(fr"pdp_{root.replace('.','-').replace('/','-')}.xlsx", output_format, report_rows)
+    reviews_writer = Reviews_Script.open_output(fr"Reviews_for_{root.replace('.', '_').replace('/','-')}.xlsx", output_format, report_rows)
+    # The shared client's pool serves all three stages; a SKU found by several searches while it is
+    # still being extracted or reviewed shares those requests, its rows written once per listing
+    client = get_client(workers * 3, cache)
+    client.new_run()
+    pdp_queue = queue.Queue(maxsize=queue_size)
+    reviews_queue = queue.Queue(maxsize=queue_size)
+
+    def extract(sku):
+        return PDP_Script.get_data_from_url(timeout, isapi, root, sku, client)
+
+    def emit_product(sku, result):
+        if result:
+            pdp_writer.append(result)
+        else:
+            log.debug("No data for %s", sku, extra={"sku": sku})
+        pdp_progress.advance(failed=not result or result.get("status_code") != 200)
+        reviews_queue.put((sku, (result or {}).get("number_of_customer_reviews")))
+
+    with ThreadPoolExecutor(max_workers=workers) as page_executor:
+        def reviews(item):
+            sku, expected_reviews = item
+            return Reviews_Script.fetch_reviews(root, sku, review_pages, retry_attempts, timeout, client,
+                                                page_executor=page_executor, expected_reviews=expected_reviews)
+
+        pdp_stage = PipelineStage("pdp", workers, extract, emit_product)
+        def emit_reviews(item, rows):
+            reviews_writer.extend(rows)
+            reviews_progress.advance(failed=any(row.get("statuscode") != 200 for row in rows))
+
+        reviews_stage = PipelineStage("reviews", workers, reviews, emit_reviews)
+        # How many SKUs the later stages get is only known once the search is done
+        with Progress("search terms", len(terms)) as search_progress, Progress("pdp SKUs") as pdp_progress, \
+                Progress("review SKUs") as reviews_progress:
+            stages = [pdp_stage.start(pdp_queue, reviews_queue), reviews_stage.start(reviews_queue)]
+            feed = SkuFeed(search_writer, pdp_queue)
+            try:
+                Search_Script.run_searches_in_threads(workers, root, terms, max_pages, timeout, feed, progress=search_progress)
+            finally:
+                pdp_queue.put(END)
+            for stage in stages:
+                stage.join()
+
+    log.info(f"Pipeline: {feed.skus} SKUs found, {pdp_stage.processed} products extracted, {reviews_stage.processed} SKUs reviewed")
+    log.info(client.coalescer.summary())
+    for writer in (search_writer, pdp_writer, reviews_writer):
+        if writer.close():
+            log.info(f"Data saved to {writer.output_file}")
+    # Past the run deadline the search stops and every queued request fails at once, so the later
+    # stages drain their queues as timed-out rows
+    if RUN_DEADLINE.expired():
+        log.warning(f"{RUN_DEADLINE.exceeded()}: partial outputs saved")
+    if cache is not None:
+        log.info(cache.summary())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    add_output_arguments(parser)
+    add_logging_arguments(parser)
+    add_breaker_arguments(parser)
+    add_timeout_arguments(parser)
+    add_hedging_arguments(parser)
+    args = parser.parse_args()
+    configure_breakers(args)
+    configure_hedging(args)
+    timeout=timeouts_from_args(args)  # Connect/read timeouts per attempt and a deadline per request across its retries
+    workers=100  # Per stage ceiling; the adaptive limiter picks how many requests are in flight
+    root = "hp.com/us"
+    terms = ["laptop", "printers", "headphone", "camera", "usb", "monitor", "vr", "keyboard", "mouse", "charger"]
+    max_pages = 4  # Search pages per term
+    with logging_from_args(args), reporter_from_args(args):
+        start_run_deadline(args.deadline)
+        main(workers, root, terms, max_pages, timeout, cache=cache_from_args(args), output_format=args.format, report_rows=args.report_rows)
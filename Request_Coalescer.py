@@ -0,0 +1,129 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from Response_Cache import cache_key
+
+# Shares the outcome of identical requests. A call whose key (endpoint, rootdomain, sku/term, page) is
+# already in flight waits on the first caller's future instead of sending. With max_results > 0 the
+# last max_results successful results are also kept for duplicates that come later, least recently used
+# first out, as retain(result) gives them (the client keeps only the status and body). That is off by
+# default: most requests are never repeated, and Response_Cache covers reuse across runs. Failures and
+# non-200 responses are never kept, so a later duplicate tries again.
+class RequestCoalescer:
+    def __init__(self, max_results=0, retain=None):
+        self.max_results = max_results
+        self.retain = retain or (lambda result: result)
+        self.sent = 0
+        self.shared = 0
+        self._in_flight = {}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def call(self, endpoint, params, send):
+        key = cache_key(endpoint, params)
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self.shared += 1
+                return result
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+                self.sent += 1
+            else:
+                self.shared += 1
+        if not owner:
+            return future.result()
+
+        try:
+            result = send()
+        except BaseException as e:
+            self._finished(key)
+            future.set_exception(e)
+            raise
+        self._finished(key, result)
+        future.set_result(result)
+        return result
+
+    def _finished(self, key, result=None):
+        with self._lock:
+            del self._in_flight[key]
+            if self.max_results and result is not None and is_reusable(result):
+                self._results[key] = self.retain(result)
+                while len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+
+    # Drop kept results and counters so a new run starts from the backend again
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.sent = 0
+            self.shared = 0
+
+    def summary(self):
+        return f"Request coalescing: {self.sent} sent, {self.shared} served from in-flight or kept duplicates"
+
+# Asyncio counterpart; all callers share one event loop, so no lock is needed
+class AsyncRequestCoalescer:
+    def __init__(self, max_results=0, retain=None):
+        self.max_results = max_results
+        self.retain = retain or (lambda result: result)
+        self.sent = 0
+        self.shared = 0
+        self._in_flight = {}
+        self._results = OrderedDict()
+
+    async def call(self, endpoint, params, send):
+        key = cache_key(endpoint, params)
+        result = self._results.get(key)
+        if result is not None:
+            self._results.move_to_end(key)
+            self.shared += 1
+            return result
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+        future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        self.sent += 1
+        try:
+            result = await send()
+        except asyncio.CancelledError:
+            del self._in_flight[key]
+            future.cancel()
+            raise
+        except BaseException as e:
+            del self._in_flight[key]
+            future.set_exception(e)
+            future.exception()  # Mark retrieved so an unshared failure is not logged as unhandled
+            raise
+        del self._in_flight[key]
+        if self.max_results and is_reusable(result):
+            self._results[key] = self.retain(result)
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        future.set_result(result)
+        return result
+
+    def summary(self):
+        return f"Request coalescing: {self.sent} sent, {self.shared} served from in-flight or kept duplicates"
+
+# Stands in when coalescing is off (coalesce=False): every call is sent. call returns whatever send
+# returns, so it serves the asyncio client as well.
+class NullCoalescer:
+    def call(self, endpoint, params, send):
+        return send()
+
+    def clear(self):
+        pass
+
+    def summary(self):
+        return "Request coalescing: off"
+
+# Only successful (response, attempts) results are worth handing to later duplicates
+def is_reusable(result):
+    response = result[0] if isinstance(result, tuple) else result
+    return getattr(response, "status_code", None) == 200
@@ -0,0 +1,99 @@
+import json
+import sqlite3
+import threading
+import time
+import requests
+
+class CacheMissError(requests.RequestException):
+    pass
+
+# Cache key parts: endpoint, rootdomain and the remaining query (sku/skus/term and page)
+def cache_key(endpoint, params):
+    request = "&".join(f"{key}={value}" for key, value in sorted(params.items()) if key != "rootdomain")
+    return endpoint, str(params.get("rootdomain", "")), request
+
+# SQLite-backed cache of successful extractor responses, shared by all three scripts.
+# Entries older than ttl seconds are misses; once the stored bodies exceed max_bytes the least
+# recently used entries are evicted. cache_only replays the cache and never touches the network.
+class ResponseCache:
+    def __init__(self, path, ttl=3600, max_bytes=1024 ** 3, cache_only=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.cache_only = cache_only
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " endpoint TEXT, rootdomain TEXT, request TEXT, status_code INTEGER, headers TEXT, content BLOB,"
+            " created_at REAL, accessed_at REAL, PRIMARY KEY (endpoint, rootdomain, request))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (accessed_at)")
+        self.size = self._db.execute("SELECT COALESCE(SUM(LENGTH(content)), 0) FROM responses").fetchone()[0]
+
+    # (status_code, content, headers) for a fresh entry, or None
+    def get(self, endpoint, params):
+        key = cache_key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status_code, headers, content, created_at FROM responses WHERE endpoint=? AND rootdomain=? AND request=?", key
+            ).fetchone()
+            if row is None or (not self.cache_only and now - row[3] > self.ttl):
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed_at=? WHERE endpoint=? AND rootdomain=? AND request=?", (now, *key))
+            self.hits += 1
+        return row[0], row[2], json.loads(row[1])
+
+    def put(self, endpoint, params, status_code, content, headers):
+        key = cache_key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            previous = self._db.execute(
+                "SELECT LENGTH(content) FROM responses WHERE endpoint=? AND rootdomain=? AND request=?", key
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, status_code, json.dumps(dict(headers)), content, now, now),
+            )
+            self.size += len(content) - (previous[0] if previous else 0)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    # Drop least recently used entries until the cache is back under 90% of max_bytes
+    def _evict(self):
+        target = self.max_bytes * 0.9
+        rows = self._db.execute("SELECT endpoint, rootdomain, request, LENGTH(content) FROM responses ORDER BY accessed_at")
+        evicted = []
+        for endpoint, rootdomain, request, length in rows:
+            if self.size <= target:
+                break
+            evicted.append((endpoint, rootdomain, request))
+            self.size -= length
+        self._db.executemany("DELETE FROM responses WHERE endpoint=? AND rootdomain=? AND request=?", evicted)
+
+    def summary(self):
+        return f"Response cache {self.path}: {self.hits} hits, {self.misses} misses, {self.size / 1024 ** 2:.1f} MB stored"
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+# Command line switches shared by the scripts
+def add_cache_arguments(parser):
+    parser.add_argument("--cache", help="SQLite file for the local response cache (disabled when omitted)")
+    parser.add_argument("--cache-ttl", type=float, default=3600, help="seconds a cached response stays fresh")
+    parser.add_argument("--cache-max-mb", type=float, default=1024, help="cache size bound; least recently used entries are evicted")
+    parser.add_argument("--cache-only", action="store_true", help="replay responses from the cache without calling the extractor")
+
+def cache_from_args(args):
+    if not args.cache:
+        if args.cache_only:
+            raise SystemExit("--cache-only needs --cache")
+        return None
+    return ResponseCache(args.cache, ttl=args.cache_ttl, max_bytes=int(args.cache_max_mb * 1024 ** 2), cache_only=args.cache_only)
@@ -0,0 +1,138 @@
+import asyncio
+import datetime
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests
+
+# Status codes worth another attempt; every other non-200 is treated as permanent
+RETRYABLE_STATUS_CODES = {408, 425, 429}
+
+def is_retryable_status(status_code):
+    return status_code in RETRYABLE_STATUS_CODES or 500 <= status_code <= 599
+
+# Connection resets and timeouts are transient; invalid URLs and the like are not
+def is_retryable_error(error):
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+# Seconds to wait according to a Retry-After header (delta-seconds or HTTP date), or None
+def parse_retry_after(response):
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+# Run-wide retry budget: every first attempt deposits `ratio` tokens and every retry spends one,
+# so retries can never add more than `ratio` extra load on top of the base request rate
+class RetryBudget:
+    def __init__(self, ratio=0.2, min_tokens=10, max_tokens=100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = float(min_tokens)
+        self.exhausted = 0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            self.exhausted += 1
+            return False
+
+# Exponential backoff with full jitter, shared by every fetch function
+class RetryPolicy:
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=30.0, budget=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget if budget is not None else RetryBudget()
+
+    # Delay before retry number `attempt` (1-based), or None when the server asked for a longer pause than we allow
+    def backoff(self, attempt, response=None):
+        retry_after = parse_retry_after(response) if response is not None else None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def should_retry(self, attempt, max_attempts, response=None, error=None):
+        if attempt >= max_attempts:
+            return False
+        if error is not None:
+            return is_retryable_error(error)
+        return is_retryable_status(response.status_code)
+
+    # No retry when the pause would not end before the request's deadline (a Deadlines.Deadline)
+    def _next_delay(self, attempt, response, deadline=None):
+        delay = self.backoff(attempt, response)
+        if delay is None:
+            return None
+        remaining = deadline.remaining() if deadline is not None else None
+        if remaining is not None and delay >= remaining:
+            return None
+        if not self.budget.withdraw():
+            return None
+        return delay
+
+    # Sleep before the next attempt; False when the budget, Retry-After or the deadline says to stop
+    def wait_before_retry(self, attempt, response=None, deadline=None):
+        delay = self._next_delay(attempt, response, deadline)
+        if delay is None:
+            return False
+        time.sleep(delay)
+        return True
+
+    async def wait_before_retry_async(self, attempt, response=None, deadline=None):
+        delay = self._next_delay(attempt, response, deadline)
+        if delay is None:
+            return False
+        await asyncio.sleep(delay)
+        return True
+
+    # Call send() until it succeeds, the failure is permanent or the deadline leaves no time for another
+    # attempt; returns (response, attempts) and re-raises the last error when every attempt raised
+    def call(self, send, max_attempts=None, deadline=None):
+        max_attempts = max_attempts or self.max_attempts
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = send()
+            except requests.RequestException as e:
+                if not self.should_retry(attempt, max_attempts, error=e) or not self.wait_before_retry(attempt, deadline=deadline):
+                    raise
+                continue
+            if not self.should_retry(attempt, max_attempts, response=response) or not self.wait_before_retry(attempt, response, deadline):
+                return response, attempt
+
+    async def call_async(self, send, max_attempts=None, deadline=None):
+        max_attempts = max_attempts or self.max_attempts
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = await send()
+            except requests.RequestException as e:
+                if not self.should_retry(attempt, max_attempts, error=e) or not await self.wait_before_retry_async(attempt, deadline=deadline):
+                    raise
+                continue
+            if not self.should_retry(attempt, max_attempts, response=response) or not await self.wait_before_retry_async(attempt, response, deadline):
+                return response, attempt
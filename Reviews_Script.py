@@ -1,160 +1,235 @@
+import argparse
 import requests
 import json
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill
 import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
+from Api_Client import get_client
+from Circuit_Breaker import add_breaker_arguments, configure_breakers
+from Deadlines import (RUN_DEADLINE, TIMED_OUT, Timeouts, add_timeout_arguments, as_completed_by_deadline, failure_status,
+                       start_run_deadline, timeouts_from_args)
+from Field_Mapping import RowSchema, response_json
+from Hedging import add_hedging_arguments, configure_hedging
+from Input_Reader import read_rows
+from Output_Writer import StreamingExcelWriter, add_output_arguments, highlight_fill as yellow_fill, open_output_writer, red_fill
+from Response_Cache import add_cache_arguments, cache_from_args
+from Run_Log import Progress, add_logging_arguments, get_logger, logging_from_args
+from Run_Metrics import add_metrics_arguments, reporter_from_args
+from Run_Journal import RunJournal, journal_path_for
 
-def fetch_reviews(root_domain, sku, max_pages, retry_attempts, timeout):
+log = get_logger("reviews")
+
+def json_field(name):
+    return lambda review: json.dumps(review.get(name, ""))
+
+# Output columns of a review row, in sheet order, mapped to fields of one reviewItems entry
+REVIEW_SCHEMA = RowSchema([
+    ("statuscode", None),
+    ("error_message", None),
+    ("sku", None),
+    ("page", None),
+    ("variantSku", "variantSku"),
+    ("reviewId", "reviewId"),
+    ("author", "author"),
+    ("rating", "rating"),
+    ("date", "date"),
+    ("purchasedDate", "purchasedDate"),
+    ("location", "location"),
+    ("attributes", json_field("attributes")),
+    ("title", "title"),
+    ("text", "text"),
+    ("productName", "productName"),
+    ("recommendedReview", "recommendedReview"),
+    ("productHasBeenTried", "productHasBeenTried"),
+    ("brandResponse", "brandResponse"),
+    ("syndicated", "syndicated"),
+    ("program", "program"),
+    ("link", "link"),
+    ("reviewImagesUrl", json_field("reviewImagesUrl")),
+    ("sellerId", "sellerId"),
+    ("timestamp", lambda review: datetime.datetime.now().isoformat()),
+], compact=True, name="ReviewRow", intern=["variantSku", "location", "productName", "program", "sellerId"])
+
+# Pages fetched at once per SKU; the next window is only opened when the last page came back full
+REVIEW_PAGE_WINDOW = 4
+
+# Fetch one review page. Returns (rows, review_count, ok); review_count is None when the page failed
+def fetch_review_page(root_domain, sku, page, retry_attempts, timeout, client=None):
+    client = client or get_client()
+    log.debug("Fetching %s - Page %s...", sku, page, extra={"sku": sku, "page": page})
+    reviews = []
+
+    try:
+        response, attempt = client.request("review", timeout, max_attempts=retry_attempts, rootdomain=root_domain, sku=sku, page=page)
+    except requests.exceptions.RequestException as e:
+        log.debug("Error fetching %s - Page %s: %s", sku, page, e, extra={"sku": sku, "page": page, "error": str(e)})
+        reviews.append(REVIEW_SCHEMA.blank(statuscode=failure_status(e), error_message=str(e), sku=sku, page=page))
+        return reviews, None, False
+
+    status_code = response.status_code
+    if status_code == 200:
+        data = response_json(response)
+        review_items = data.get("reviewItems", [])
+
+        for review in review_items:
+            reviews.append(REVIEW_SCHEMA.build(review, statuscode=status_code, sku=sku, page=page))
+        return reviews, len(review_items), True
+
+    log.debug("Attempt %s: Status code %s for %s - Page %s", attempt, status_code, sku, page,
+              extra={"sku": sku, "page": page, "status": status_code, "attempts": attempt})
+    reviews.append(REVIEW_SCHEMA.blank(statuscode=status_code, error_message=response.text, sku=sku, page=page))
+    return reviews, None, False
+
+# Pages the expected review count needs once the page size is known
+def planned_pages(expected_reviews, page_size):
+    return -(-expected_reviews // page_size)
+
+# Pages are requested in windows of `window` pages on page_executor (one at a time without one) and
+# reassembled in page order. The first empty page ends the SKU and drops whatever is still outstanding;
+# a short last page means there is nothing after it. expected_reviews (numberOfCustomerReviews from a
+# PDP result) widens the second window to every page it predicts.
+# done_pages maps pages journaled by an earlier run to their review count; an empty one ends the SKU
+def fetch_reviews(root_domain, sku, max_pages, retry_attempts, timeout, client=None, journal=None, done_pages=None,
+                  page_executor=None, window=REVIEW_PAGE_WINDOW, expected_reviews=None):
+    client = client or get_client()
+    done_pages = done_pages or {}
     all_reviews = []
+    page_size = max(done_pages.values(), default=0)
+    next_page = 1
 
-    for page in range(1, max_pages + 1):
-        print(f"Fetching {sku} - Page {page}...")
-        url = f"http://localhost:5000/api/review?rootdomain={root_domain}&sku={sku}&page={page}"
+    while next_page <= max_pages:
+        size = window
+        if expected_reviews is not None and page_size:
+            size = max(size, planned_pages(expected_reviews, page_size) - next_page + 1)
+        pages = range(next_page, min(next_page + size, max_pages + 1))
+        next_page = pages[-1] + 1
+        futures = {}
+        if page_executor is not None:
+            futures = {page: page_executor.submit(fetch_review_page, root_domain, sku, page, retry_attempts, timeout, client)
+                       for page in pages if page not in done_pages}
 
-        for attempt in range(1, retry_attempts + 1):  # Retry logic
-            try:
-                response = requests.get(url, timeout=timeout)
-                status_code = response.status_code
-
-                if status_code == 200:
-                    data = response.json()
-                    review_items = data.get("reviewItems", [])
-
-                    if not review_items:
-                        print(f"No more reviews for {sku} on page {page}. Stopping.")
-                        break
-
-                    for review in review_items:
-                        all_reviews.append({
-                            "statuscode": status_code,
-                            "error_message": None,
-                            "sku": sku,
-                            "page": page,
-                            "variantSku": review.get("variantSku"), 
-                            "reviewId": review.get("reviewId"), 
-                            "author": review.get("author"), 
-                            "rating": review.get("rating"), 
-                            "date": review.get("date"), 
-                            "purchasedDate": review.get("purchasedDate"), 
-                            "location": review.get("location"), 
-                            "attributes": json.dumps(review.get("attributes", "")),  
-                            "title": review.get("title"),
-                            "text": review.get("text"),
-                            "productName": review.get("productName"),  
-                            "recommendedReview": review.get("recommendedReview"), 
-                            "productHasBeenTried": review.get("productHasBeenTried"), 
-                            "brandResponse": review.get("brandResponse"), 
-                            "syndicated": review.get("syndicated"),
-                            "program": review.get("program"), 
-                            "link": review.get("link"), 
-                            "reviewImagesUrl": json.dumps(review.get("reviewImagesUrl", "")),  
-                            "sellerId": review.get("sellerId"),
-                            "timestamp": datetime.datetime.now().isoformat()
-                        })
-                    break  # Exit retry loop on success
-                else:
-                    print(f"Attempt {attempt}: Status code {status_code} for {sku} - Page {page}")
-                    if attempt == retry_attempts:
-                        all_reviews.append({
-                            "statuscode": status_code,
-                            "error_message": response.text,
-                            "sku": sku,
-                            "page": page
-                        })
-            except requests.exceptions.RequestException as e:
-                print(f"Attempt {attempt}: Error fetching {sku} - Page {page}: {e}")
-                if attempt == retry_attempts:
-                    all_reviews.append({
-                        "statuscode": "Request Failed",
-                        "error_message": str(e),
-                        "sku": sku,
-                        "page": page
-                    })
+        finished = False
+        for page in pages:
+            if page in done_pages:
+                reviews, count, ok = None, done_pages[page], True
+            elif page in futures:
+                reviews, count, ok = futures[page].result()
+            else:
+                reviews, count, ok = fetch_review_page(root_domain, sku, page, retry_attempts, timeout, client)
+
+            if ok and count == 0:
+                log.debug("No more reviews for %s on page %s. Stopping.", sku, page, extra={"sku": sku, "page": page})
+                if reviews is not None:
+                    record_page(journal, sku, page, [], ok=True)
+                finished = True
+                break
+            if reviews is not None:
+                all_reviews.extend(reviews)
+                record_page(journal, sku, page, reviews, ok=ok)
+            if ok:
+                page_size = max(page_size, count)
+
+        if finished or (ok and count < page_size):
+            for future in futures.values():
+                future.cancel()
+            break
 
     return all_reviews
 
+def record_page(journal, sku, page, reviews, ok):
+    if journal is not None:
+        journal.record("review", [sku, page], reviews, ok=ok)
+
+FIELDS = REVIEW_SCHEMA.columns
+
+def serialize_review_value(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+# Per-row highlighting; a review ID already written earlier in the sheet is marked red
+def review_row_fills():
+    seen_review_ids = set()
+
+    def row_fills(review, values):
+        fills = {}
+        # ✅ Highlight duplicate Review IDs
+        review_id = str(review.get("reviewId", "")).strip()
+        if review_id:
+            if review_id in seen_review_ids:
+                fills["reviewId"] = red_fill
+            seen_review_ids.add(review_id)
+
+        # ✅ Highlight blank cells in Yellow
+        for field, value in zip(FIELDS, values):
+            if value in [None, "", False, "False", 0, "0", "Unknown", "unknown"]:
+                fills[field] = yellow_fill
+
+        # ✅ Highlight invalid URLs
+        for url_col in ["link", "reviewImagesUrl"]:
+            value = values[FIELDS.index(url_col)]
+            if value and not str(value).startswith("http"):
+                fills[url_col] = yellow_fill
+
+        # ✅ Highlight status codes that are not 200
+        value = values[FIELDS.index("statuscode")]
+        if value and str(value) != "200":
+            fills["statuscode"] = red_fill
+        return fills
+
+    return row_fills
+
+# Streaming writer for review rows; headers go red when all non-null values are the same
+def open_excel_writer(output_path):
+    return StreamingExcelWriter(output_path, FIELDS, "Reviews Data", row_fills=review_row_fills(),
+                                serialize=serialize_review_value, same_value_ignore=[None, "", " "])
+
+# Review rows in the chosen output format; with another format the highlighted workbook is an optional sample report
+def open_output(output_path, output_format="xlsx", report_rows=0):
+    return open_output_writer(output_path, FIELDS, open_excel_writer, output_format, report_rows, serialize=serialize_review_value)
+
 def save_to_excel(reviews, output_path):
     if not reviews:
-        print("No reviews to save. Skipping Excel file creation.")
+        log.info("No reviews to save. Skipping Excel file creation.")
         return
 
-    fields = ["statuscode", "error_message", "sku", "page", "variantSku", "reviewId", "author", "rating", "date", "purchasedDate", 
-              "location", "attributes", "title", "text", "productName", "recommendedReview", "productHasBeenTried", "brandResponse", 
-              "syndicated", "program", "link", "reviewImagesUrl", "sellerId", "timestamp"]
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Reviews Data"
-    ws.append(fields)
-
-    review_id_idx = fields.index("reviewId") + 1  # Review ID column index (1-based)
-    review_counts = {}
-
-    for review in reviews:
-        row_data = []
-        for field in fields:
-            value = review.get(field, "")
-            if isinstance(value, (list, dict)):
-                value = json.dumps(value)  
-            row_data.append(value)
-        ws.append(row_data)
-
-    for review in reviews:
-        review_id = str(review.get("reviewId", "")).strip()
-        if review_id:
-            review_counts[review_id] = review_counts.get(review_id, []) + [ws.max_row]
-
-
-    # ✅ Apply Formatting
-    red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")  # Red for duplicates
-  
-    # ✅ Highlight duplicate Review IDs
-    for review_id, rows in review_counts.items():
-        if len(rows) > 1:  # Mark only if duplicate
-            for row_idx in rows:
-                ws.cell(row=row_idx, column=review_id_idx).fill = red_fill
-
-
-    # ✅ Highlight blank cells in Yellow
-    yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-    for col_idx in range(1, len(fields) + 1):
-        for row_idx in range(2, ws.max_row + 1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            if cell.value in [None, "", False, "False", 0, "0", "Unknown", "unknown"]:
-                cell.fill = yellow_fill
-
-    # ✅ Highlight invalid URLs
-    url_columns = ["link", "reviewImagesUrl"]
-    for url_col in url_columns:
-        col_idx = fields.index(url_col) + 1
-        for row_idx in range(2, ws.max_row + 1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            if cell.value and not str(cell.value).startswith("http"):
-                cell.fill = yellow_fill
-
-    # ✅ Highlight status codes that are not 200
-    status_col_idx = fields.index("statuscode") + 1
-    for row_idx in range(2, ws.max_row + 1):
-        cell = ws.cell(row=row_idx, column=status_col_idx)
-        if cell.value and str(cell.value) != "200":
-            cell.fill = red_fill  
-
-    # ✅ Highlight headers in Red if all non-null values are the same
-    for col_idx, header in enumerate(fields, start=1):
-        column_values = [ws.cell(row=row_idx, column=col_idx).value for row_idx in range(2, ws.max_row + 1)]
-        non_empty_values = [val for val in column_values if val not in [None, "", " "]]
-        
-        if non_empty_values and len(set(non_empty_values)) == 1:
-            ws.cell(row=1, column=col_idx).fill = red_fill
+    writer = open_excel_writer(output_path)
+    writer.extend(reviews)
+    writer.close()
+    log.info(f"Reviews saved to {output_path}")
+
+# (sku, copy) for each listing, copy counting earlier listings of the same SKU
+def listings(skus):
+    seen = {}
+    for sku in skus:
+        yield sku, seen.get(sku, 0)
+        seen[sku] = seen.get(sku, 0) + 1
 
-    wb.save(output_path)
-    print(f"Reviews saved to {output_path}")
+# Journaled pages of one listing of a SKU: page entries are written once per listing, so the
+# copy-th listing owns the pages journaled more than `copy` times
+def done_pages_for(completed, completions, sku, copy):
+    return {page: count for (done_sku, page), count in completed.items() if done_sku == sku and completions.get((done_sku, page), 0) > copy}
 
-def main():
+# numberOfCustomerReviews per SKU from a PDP output (xlsx, csv, jsonl or parquet), used to plan how many pages to request
+def read_review_counts(pdp_file):
+    counts = {}
+    for sku, count in read_rows(pdp_file, ["sku", "number_of_customer_reviews"]):
+        if sku in (None, "") or count in (None, ""):
+            continue
+        try:
+            counts[str(sku)] = int(float(count))
+        except ValueError:
+            continue
+    return counts
+
+# With resume=True, (sku, page) results already in the run journal are restored instead of fetched again.
+# cache is an optional Response_Cache.ResponseCache shared by repeated runs.
+# review_counts maps SKUs to their expected review count (see read_review_counts).
+# output_format picks xlsx, csv, jsonl or parquet; report_rows adds a highlighted workbook of the first rows.
+# timeout is a Deadlines.Timeouts (connect/read per attempt, total per request across retries).
+def main(resume=False, cache=None, review_counts=None, output_format="xlsx", report_rows=0, skus=None, workers=100,
+         root_domain="hp.com/us", timeout=None):
     # ✅ Edit these values easily
-    root_domain = "hp.com/us"
-    skus = [
+    skus = skus or [
   "HP-LAPTOP-17-CP3047NR",
   "HP-LAPTOP-17T-CN400-173-9Z462AV-1",
   "HP-LAPTOP-17-CN4047NR",
@@ -175,28 +250,77 @@ def main():
 ] # Add multiple SKUs here
     max_pages = 4  # Number of pages per SKU
     retry_attempts = 3  # Max retry attempts for API requests
-    timeout = 5000 # Timeout for API requests in seconds
-    workers = 100  # Number of workers for ThreadPoolExecutor
+    timeout = timeout or Timeouts(connect=10, read=120, total=600)  # Seconds to connect, to read, and per request across retries
+    # workers: threads per pool (SKUs and pages); the adaptive limiter picks how many requests are in flight
+
+    review_counts = review_counts or {}
 
     output_path = fr"Reviews_for_{root_domain.replace('.', '_').replace('/','-')}.xlsx"
     
-    all_reviews = []
+    writer = open_output(output_path, output_format, report_rows)
+    client = get_client(workers, cache)
+    client.new_run()  # Repeated SKUs fetched at the same time share page requests
+    journal = RunJournal(journal_path_for(output_path))
+    completed = {}
+    completions = {}
+    if resume:
+        completed = journal.completed("review")
+        completions = journal.completions("review")
+        restored = journal.replay("review", writer)
+        log.info(f"Resuming: {restored} pages restored from journal")
+    journal.open(resume)
     
-    with ThreadPoolExecutor(workers) as executor:
-        future_to_sku = {executor.submit(fetch_reviews, root_domain, sku, max_pages, retry_attempts, timeout): sku for sku in skus}
+    # SKU tasks only wait on their pages, which run on a separate pool so the two never starve each other
+    # Progress counts listed SKUs; a SKU with any failed page counts as failed
+    with journal, ThreadPoolExecutor(workers) as executor, ThreadPoolExecutor(workers) as page_executor, \
+            Progress("review SKUs", len(skus)) as progress:
+        future_to_sku = {executor.submit(fetch_reviews, root_domain, sku, max_pages, retry_attempts, timeout, client, journal,
+                                         done_pages_for(completed, completions, sku, copy),
+                                         page_executor, expected_reviews=review_counts.get(sku)): sku for sku, copy in listings(skus)}
         
-        for future in as_completed(future_to_sku):
-            sku = future_to_sku[future]
+        # SKUs not started when the run deadline passes get a timed-out row and are fetched again on --resume
+        def time_out_sku(future):
+            sku = future_to_sku.pop(future)
+            writer.append(REVIEW_SCHEMA.blank(statuscode=TIMED_OUT, error_message=str(RUN_DEADLINE.exceeded()), sku=sku))
+            progress.advance(failed=1)
+
+        for future in as_completed_by_deadline(future_to_sku, time_out_sku):
+            sku = future_to_sku.pop(future)
             try:
                 reviews = future.result()
-                all_reviews.extend(reviews)
+                writer.extend(reviews)
+                progress.advance(failed=any(review.get("statuscode") != 200 for review in reviews))
             except Exception as e:
-                print(f"Error processing SKU {sku}: {e}")
+                log.error("Error processing SKU %s: %s", sku, e, exc_info=True)
+                progress.advance(failed=1)
+
+    client.log_concurrency()
+    log.info(client.coalescer.summary())
 
-    if all_reviews:
-        save_to_excel(all_reviews, output_path)
+    if writer.close():
+        log.info(f"Reviews saved to {writer.output_file}")
     else:
-        print("No reviews retrieved. Excel file will not be created.")
+        log.info("No reviews retrieved. Excel file will not be created.")
+    if RUN_DEADLINE.expired():
+        log.warning(f"{RUN_DEADLINE.exceeded()}: partial output saved")
+    if cache is not None:
+        log.info(cache.summary())
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="skip pages already in the run journal and rebuild the workbook from it")
+    parser.add_argument("--pdp-output", help="PDP workbook whose number_of_customer_reviews column plans the pages per SKU")
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    add_output_arguments(parser)
+    add_logging_arguments(parser)
+    add_breaker_arguments(parser)
+    add_timeout_arguments(parser)
+    add_hedging_arguments(parser)
+    args = parser.parse_args()
+    configure_breakers(args)
+    configure_hedging(args)
+    with logging_from_args(args), reporter_from_args(args):
+        start_run_deadline(args.deadline)
+        main(args.resume, cache_from_args(args), read_review_counts(args.pdp_output) if args.pdp_output else None,
+             args.format, args.report_rows, timeout=timeouts_from_args(args))
@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+from Field_Mapping import json_default
+
+# Default journal location next to the output workbook
+def journal_path_for(output_file):
+    return f"{output_file}.journal.jsonl"
+
+# Append-only JSONL record of completed work units (a SKU, a search (term, page) or a review (sku, page)).
+# Each line holds the unit's key, whether it succeeded and the rows it produced, so an interrupted
+# run can skip finished units and rebuild the workbook without fetching them again.
+class RunJournal:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    # resume=False starts a fresh journal; resume=True keeps appending to the existing one
+    def open(self, resume=False):
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        return self
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, kind, key, rows, ok=True):
+        line = json.dumps({"kind": kind, "key": key, "ok": ok, "rows": rows}, default=json_default)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    # Entries of one kind in journal order; a torn last line from a crash is ignored
+    def entries(self, kind):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("kind") == kind:
+                    yield entry
+
+    # Units that finished successfully and do not need to be fetched again, mapped to their row count
+    def completed(self, kind):
+        return {journal_key(entry["key"]): len(entry["rows"]) for entry in self.entries(kind) if entry["ok"]}
+
+    # How many times each unit succeeded; a key listed several times in the input is journaled once per listing
+    def completions(self, kind):
+        counts = {}
+        for entry in self.entries(kind):
+            if entry["ok"]:
+                key = journal_key(entry["key"])
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+
+    # Stream the rows of every successful unit into a writer. Completed keys are never fetched again,
+    # so repeated successes for a key come from duplicate inputs and are all kept.
+    def replay(self, kind, writer):
+        replayed = 0
+        for entry in self.entries(kind):
+            if entry["ok"]:
+                writer.extend(entry["rows"])
+                replayed += 1
+        return replayed
+
+# JSON turns tuple keys into lists; normalise back so keys can live in sets
+def journal_key(key):
+    return tuple(key) if isinstance(key, list) else key
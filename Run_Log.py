@@ -0,0 +1,123 @@
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+# All script loggers live under this name, so one queue handler on it catches everything
+LOGGER_NAME = "extractor"
+LOG_LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR"]
+PROGRESS_INTERVAL = 5  # Seconds between progress lines
+
+def get_logger(name):
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+# Attributes every LogRecord has; anything else on a record came from `extra` and is a structured field
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# One JSON object per record: time, level, logger, message and the record's extra fields
+class JsonlFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": record.created, "level": record.levelname, "logger": record.name, "message": record.getMessage()}
+        entry.update((key, value) for key, value in vars(record).items() if key not in STANDARD_ATTRIBUTES)
+        return json.dumps(entry, default=str)
+
+# Worker threads only put records on a queue; a single listener thread formats them and writes the
+# console (at `level`) and the optional JSONL file (everything, debug included). Leaving the context
+# drains the queue before returning. label (e.g. the rootdomain of a market run) prefixes console lines.
+class RunLog:
+    def __init__(self, level="INFO", log_file=None, label=None):
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        self.log_file = log_file
+        self.label = label
+        self.listener = None
+
+    def __enter__(self):
+        console = logging.StreamHandler(sys.stdout)
+        console.setLevel(self.level)
+        prefix = f"[{self.label}] ".replace("%", "%%") if self.label else ""
+        console.setFormatter(logging.Formatter(f"%(asctime)s %(levelname)s {prefix}%(message)s", "%H:%M:%S"))
+        handlers = [console]
+        if self.log_file:
+            log_file = logging.FileHandler(self.log_file, mode="a", encoding="utf-8")
+            log_file.setFormatter(JsonlFormatter())
+            handlers.append(log_file)
+        records = queue.SimpleQueue()
+        self.listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        self.queue_handler = logging.handlers.QueueHandler(records)
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.addHandler(self.queue_handler)
+        logger.setLevel(logging.DEBUG if self.log_file else self.level)
+        logger.propagate = False
+        self.listener.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.removeHandler(self.queue_handler)
+        logger.propagate = True
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+# Aggregated progress for a run: completed/total, rate, failures and ETA, logged every `interval`
+# seconds (PROGRESS_INTERVAL by default, 0 for the final line only) from a background thread and once
+# more when the run ends. total=None (not known up front) reports the count and rate only.
+class Progress:
+    def __init__(self, label, total=None, interval=None, logger=None):
+        self.label = label
+        self.total = total
+        self.interval = PROGRESS_INTERVAL if interval is None else interval
+        self.logger = logger or get_logger("progress")
+        self.completed = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def advance(self, count=1, failed=0):
+        with self._lock:
+            self.completed += count
+            self.failed += failed
+
+    def line(self):
+        with self._lock:
+            completed, failed = self.completed, self.failed
+        elapsed = time.monotonic() - self.started_at
+        rate = completed / elapsed if elapsed > 0 else 0.0
+        if self.total:
+            text = f"{self.label}: {completed}/{self.total} ({completed / self.total:.0%})"
+        else:
+            text = f"{self.label}: {completed} done"
+        text += f", {rate:.1f}/s, {failed} failed, {elapsed:.0f}s elapsed"
+        if self.total and rate > 0 and completed < self.total:
+            text += f", ETA {(self.total - completed) / rate:.0f}s"
+        return text
+
+    def __enter__(self):
+        self.started_at = time.monotonic()
+        if self.interval:
+            self._thread = threading.Thread(target=self._run, name=f"{self.label}-progress", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.logger.info(self.line())
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.logger.info(self.line())
+
+# Command line switches shared by the scripts
+def add_logging_arguments(parser):
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default="INFO", help="console log level; DEBUG shows every request")
+    parser.add_argument("--log-file", help="also write every record, debug included, to this JSONL file")
+
+def logging_from_args(args):
+    return RunLog(args.log_level, args.log_file)
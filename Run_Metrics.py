@@ -0,0 +1,225 @@
+import bisect
+import json
+import threading
+import time
+from Run_Log import get_logger
+
+log = get_logger("metrics")
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket catches everything slower
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+# Counters for one (endpoint, rootdomain): a latency histogram, responses by status code (or by
+# exception name for requests that raised), retries, bytes received and requests in flight
+class EndpointMetrics:
+    def __init__(self, endpoint, rootdomain):
+        self.endpoint = endpoint
+        self.rootdomain = rootdomain
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.requests = 0
+        self.statuses = {}
+        self.retries = 0
+        self.bytes = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def observe(self, latency, status, size):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.latency_sum += latency
+        self.requests += 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytes += size
+
+    # Latency quantile estimated from the histogram, interpolating inside the bucket
+    def quantile(self, q):
+        if not self.requests:
+            return None
+        rank = q * self.requests
+        seen = 0
+        lower = 0.0
+        for upper, count in zip(LATENCY_BUCKETS, self.buckets):
+            if count and seen + count >= rank:
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return lower
+
+    @property
+    def failures(self):
+        return sum(count for status, count in self.statuses.items() if status != "200")
+
+    def snapshot(self):
+        return {
+            "endpoint": self.endpoint,
+            "rootdomain": self.rootdomain,
+            "requests": self.requests,
+            "latency_seconds": {"sum": self.latency_sum, "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99),
+                                "buckets": {str(upper): count for upper, count in zip(LATENCY_BUCKETS, self.buckets)}},
+            "statuses": dict(self.statuses),
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+        }
+
+# Run-wide request metrics labelled by endpoint and rootdomain, fed by the API clients
+class Metrics:
+    def __init__(self):
+        self.series = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def _series(self, endpoint, rootdomain):
+        key = (endpoint, str(rootdomain or ""))
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = EndpointMetrics(*key)
+        return series
+
+    # Call around every HTTP attempt: started() returns the start time to pass to finished()
+    def started(self, endpoint, rootdomain):
+        with self._lock:
+            series = self._series(endpoint, rootdomain)
+            series.in_flight += 1
+            series.peak_in_flight = max(series.peak_in_flight, series.in_flight)
+        return time.monotonic()
+
+    # Returns the attempt's latency in seconds
+    def finished(self, endpoint, rootdomain, start, response=None, error=None):
+        latency = time.monotonic() - start
+        if response is not None:
+            status, size = str(response.status_code), len(response.content or b"")
+        else:
+            status, size = type(error).__name__ if error is not None else "aborted", 0
+        with self._lock:
+            series = self._series(endpoint, rootdomain)
+            series.in_flight -= 1
+            series.observe(latency, status, size)
+        return latency
+
+    def retried(self, endpoint, rootdomain, retries):
+        if retries > 0:
+            with self._lock:
+                self._series(endpoint, rootdomain).retries += retries
+
+    # Start counting afresh; requests still in flight stay counted so their completion balances out
+    def reset(self):
+        with self._lock:
+            series = {}
+            for key, old in self.series.items():
+                if old.in_flight:
+                    series[key] = EndpointMetrics(*key)
+                    series[key].in_flight = old.in_flight
+            self.series = series
+            self.started_at = time.time()
+
+    def summary_lines(self):
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        with self._lock:
+            series_list = sorted(self.series.values(), key=lambda series: (series.endpoint, series.rootdomain))
+            lines = []
+            for series in series_list:
+                if not series.requests and not series.in_flight:
+                    continue
+                p50, p95, p99 = (series.quantile(q) or 0 for q in (0.5, 0.95, 0.99))
+                lines.append(f"{series.endpoint} {series.rootdomain}: {series.requests} requests ({series.requests / elapsed:.1f}/s), "
+                             f"p50 {p50 * 1000:.0f}ms p95 {p95 * 1000:.0f}ms p99 {p99 * 1000:.0f}ms, {series.failures} failed, "
+                             f"{series.retries} retries, {series.bytes / 1024 ** 2:.1f} MB, {series.in_flight} in flight (peak {series.peak_in_flight})")
+            return lines
+
+    def print_summary(self):
+        for line in self.summary_lines():
+            log.info(f"[metrics] {line}")
+
+    def snapshot(self):
+        with self._lock:
+            return {"started_at": self.started_at, "taken_at": time.time(),
+                    "series": [series.snapshot() for series in self.series.values()]}
+
+    def to_prometheus(self):
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            series_list = list(self.series.values())
+            metric("extractor_request_duration_seconds", "histogram", "Latency of extractor HTTP attempts")
+            for series in series_list:
+                labels = prometheus_labels(series)
+                cumulative = 0
+                for upper, count in zip(LATENCY_BUCKETS, series.buckets):
+                    cumulative += count
+                    le = "+Inf" if upper == float("inf") else repr(upper)
+                    lines.append(f'extractor_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"extractor_request_duration_seconds_sum{{{labels}}} {series.latency_sum}")
+                lines.append(f"extractor_request_duration_seconds_count{{{labels}}} {series.requests}")
+            metric("extractor_responses_total", "counter", "Attempts by HTTP status code or exception name")
+            for series in series_list:
+                for status, count in sorted(series.statuses.items()):
+                    lines.append(f'extractor_responses_total{{{prometheus_labels(series)},status="{status}"}} {count}')
+            for name, kind, attribute, help_text in [
+                ("extractor_retries_total", "counter", "retries", "Retries after a failed attempt"),
+                ("extractor_response_bytes_total", "counter", "bytes", "Response body bytes received"),
+                ("extractor_in_flight", "gauge", "in_flight", "Requests currently in flight"),
+                ("extractor_in_flight_peak", "gauge", "peak_in_flight", "Most requests in flight at once"),
+            ]:
+                metric(name, kind, help_text)
+                for series in series_list:
+                    lines.append(f"{name}{{{prometheus_labels(series)}}} {getattr(series, attribute)}")
+        return "\n".join(lines) + "\n"
+
+    # Write the end-of-run snapshot: Prometheus text for .prom/.txt files, JSON otherwise
+    def write_snapshot(self, path):
+        with open(path, "w", encoding="utf-8") as snapshot_file:
+            if path.endswith((".prom", ".txt")):
+                snapshot_file.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), snapshot_file, indent=2)
+
+def prometheus_labels(series):
+    rootdomain = series.rootdomain.replace("\\", "\\\\").replace('"', '\\"')
+    return f'endpoint="{series.endpoint}",rootdomain="{rootdomain}"'
+
+# Process-wide metrics shared by every API client
+METRICS = Metrics()
+
+# Prints the summary every `interval` seconds until the run ends, then writes the snapshot file if asked
+class MetricsReporter:
+    def __init__(self, metrics=METRICS, interval=30, snapshot_path=None):
+        self.metrics = metrics
+        self.interval = interval
+        self.snapshot_path = snapshot_path
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if self.interval:
+            self._thread = threading.Thread(target=self._run, name="metrics-reporter", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.metrics.print_summary()
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.metrics.print_summary()
+        if self.snapshot_path:
+            self.metrics.write_snapshot(self.snapshot_path)
+            log.info(f"Metrics snapshot saved to {self.snapshot_path}")
+
+# Command line switches shared by the scripts
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics", help="write a metrics snapshot at the end (.prom for Prometheus text, otherwise JSON)")
+    parser.add_argument("--metrics-interval", type=float, default=30, help="seconds between metrics summaries (0 disables)")
+
+def reporter_from_args(args):
+    return MetricsReporter(interval=args.metrics_interval, snapshot_path=args.metrics)
@@ -1,244 +1,342 @@
+import argparse
 import requests
-import pandas as pd
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill
 import datetime
 from concurrent.futures import ThreadPoolExecutor
+from Api_Client import get_client
+from Circuit_Breaker import add_breaker_arguments, configure_breakers
+from Deadlines import (RUN_DEADLINE, TIMED_OUT, add_timeout_arguments, as_completed_by_deadline, failure_status, start_run_deadline,
+                       timeouts_from_args)
+from Field_Mapping import RowSchema, response_json
+from Hedging import add_hedging_arguments, configure_hedging
+from Output_Writer import StreamingExcelWriter, add_output_arguments, highlight_fill, open_output_writer, red_fill
+from Response_Cache import add_cache_arguments, cache_from_args
+from Run_Log import Progress, add_logging_arguments, get_logger, logging_from_args
+from Run_Metrics import add_metrics_arguments, reporter_from_args
+from Run_Journal import RunJournal, journal_path_for
 
-def get_search_data(root, term, max_pages,timeout):
+log = get_logger("search")
+
+def timestamp(item):
+    return datetime.datetime.now().isoformat()
+
+# Output columns of a search row, in sheet order, mapped to paths inside one searchItems entry;
+# fields missing from an item come out as ""
+SEARCH_SCHEMA = RowSchema([
+    ("statuscode", None),
+    ("error_message", None),
+    ("search_term", None),
+    ("page", None),
+    ("rank", None),
+    ("title", "title"),
+    ("brand", "brand"),
+    ("price", "price"),
+    ("url", "url"),
+    ("sku", "sku"),
+    ("duplicate_sku", None),  # Filled in by mark_duplicate_skus as rows are written
+    ("rootdomain", "rootdomain"),
+    ("average_customer_review", "averageCustomerReview"),
+    ("number_of_customer_reviews", "numberOfCustomerReviews"),
+    ("number_of_customer_ratings", "sellerSku.skuEntry.numberOfCustomerRatings"),
+    ("mpn", "mpn"),
+    ("is_sponsored", "isSponsored"),
+    ("promo_text", "promoText"),
+    ("shipping_type", "shippingType"),
+    ("get_it_by", "getItBy"),
+    ("number_of_favorites", "numberOfFavorites"),
+    ("list_price", "listPrice"),
+    ("open_box_price", "openBoxPrice"),
+    ("bestseller_text", "bestsellerText"),
+    ("quantity_sold", "quantitySold"),
+    ("description", "sellerSku.skuEntry.description"),
+    ("image_url", "sellerSku.skuEntry.imageUrl"),
+    ("upc", "sellerSku.skuEntry.upc"),
+    ("seller_id", "sellerSku.sellerId"),
+    ("timestamp", timestamp),
+], missing="", compact=True, name="SearchRow", intern=["brand", "rootdomain", "seller_id", "shipping_type", "get_it_by"])
+
+# Fetch one result page for a term. Returns (rows, item_count, ok); ranks in the rows are positions
+# within the page until the scheduler adds the sizes of the pages before it
+def get_search_page(root, term, page, timeout, client=None):
+    client = client or get_client()
     try:
         extracted_data = []
-        print(f"Processing term: {term}")
-        for page in range(1, max_pages + 1):  # Loop through multiple pages
-            print(f"{term} - Page {page}")
-            response = requests.get(f"http://localhost:5000/api/search?rootdomain={root}&term={term}&page={page}",timeout=timeout)
+        log.debug("%s - Page %s", term, page, extra={"term": term, "page": page})
+        response, count = client.request("search", timeout, max_attempts=5, rootdomain=root, term=term, page=page)
+
+        if response.status_code == 200:
+            data = response_json(response)
+            log.debug("%s - Page %s succeeded after %s attempts", term, page, count, extra={"term": term, "page": page, "status": 200, "attempts": count})
             
-            count = 1
-            while response.status_code != 200 and count < 5:  # Retry up to 3 times
-                response = requests.get(f"http://localhost:5000/api/search?rootdomain={root}&term={term}&page={page}",timeout=timeout*(count+1))
-                count += 1
-
-            if response.status_code == 200:
-                data = response.json()
-                print(f"{term} - Page {page} succeeded after {count} attempts")
-                
-                search_items = data.get("searchItems", []) or []
-                for index, item in enumerate(search_items, start=1):
-                    # Safely get seller_sku and sku_entry with default empty dicts
-                    seller_sku = item.get("sellerSku", {}) or {}
-                    sku_entry = seller_sku.get("skuEntry", {}) or {}
-                    
-                    # Create a dictionary with safe defaults for all fields
-                    extracted_data.append({
-                        "statuscode": response.status_code,
-                        "error_message": None,
-                        "search_term": term,
-                        "page": page,
-                        "rank": (page - 1) * len(search_items) + index,
-                        "title": item.get("title", ""),
-                        "brand": item.get("brand", ""),
-                        "price": item.get("price", ""),
-                        "url": item.get("url", ""),
-                        "sku": item.get("sku", ""),
-                        "rootdomain": item.get("rootdomain", ""),
-                        "average_customer_review": item.get("averageCustomerReview", ""),
-                        "number_of_customer_reviews": item.get("numberOfCustomerReviews", ""),
-                        "number_of_customer_ratings": sku_entry.get("numberOfCustomerRatings", ""),
-                        "mpn": item.get("mpn", ""),
-                        "is_sponsored": item.get("isSponsored", ""),
-                        "promo_text": item.get("promoText", ""),
-                        "shipping_type": item.get("shippingType", ""),
-                        "get_it_by": item.get("getItBy", ""),
-                        "number_of_favorites": item.get("numberOfFavorites", ""),
-                        "list_price": item.get("listPrice", ""),
-                        "open_box_price": item.get("openBoxPrice", ""),
-                        "bestseller_text": item.get("bestsellerText", ""),
-                        "quantity_sold": item.get("quantitySold", ""),
-                        "description": sku_entry.get("description", ""),
-                        "image_url": sku_entry.get("imageUrl", ""),
-                        "upc": sku_entry.get("upc", ""),
-                        "seller_id": seller_sku.get("sellerId", ""),
-                        "timestamp": datetime.datetime.now().isoformat()
-                    })
-            else:
-                error_message = response.text  # Capture error message from response
-
-                extracted_data.append({
-                    "statuscode": response.status_code,
-                    "error_message": error_message,
-                    "search_term": term,
-                    "page": page,
-                    "rank": None,
-                    "title": None,
-                    "brand": None,
-                    "price": None,
-                    "url": None,
-                    "sku": None,
-                    "rootdomain": None,
-                    "average_customer_review": None,
-                    "number_of_customer_reviews": None,
-                    "number_of_customer_ratings": None,  # New field added
-                    "mpn": None,
-                    "is_sponsored": None,
-                    "promo_text": None,
-                    "shipping_type": None,
-                    "get_it_by": None,
-                    "number_of_favorites": None,
-                    "list_price": None,
-                    "open_box_price": None,
-                    "bestseller_text": None,
-                    "quantity_sold": None,
-                    "description": None,
-                    "image_url": None,
-                    "upc": None,
-                    "seller_id": None,
-                    "timestamp": datetime.datetime.now().isoformat()
-                })
-
-                print(f"Failed to fetch data for term '{term}' on page {page}, Status Code: {response.status_code}")
+            search_items = data.get("searchItems", []) or []
+            for index, item in enumerate(search_items, start=1):
+                extracted_data.append(SEARCH_SCHEMA.build(item, statuscode=response.status_code, search_term=term, page=page, rank=index))
+        else:
+            error_message = response.text  # Capture error message from response
+            extracted_data.append(SEARCH_SCHEMA.blank(statuscode=response.status_code, error_message=error_message, search_term=term,
+                                                      page=page, timestamp=datetime.datetime.now().isoformat()))
+
+            log.debug("Failed to fetch data for term '%s' on page %s, Status Code: %s", term, page, response.status_code,
+                      extra={"term": term, "page": page, "status": response.status_code, "attempts": count})
         
-        return extracted_data
+        if response.status_code == 200:
+            return extracted_data, len(search_items), True
+        return extracted_data, None, False
     except requests.RequestException as e:
-        print(f"Error fetching data for term '{term}': {e}")
-        return []
+        log.debug("Error fetching data for term '%s' on page %s: %s", term, page, e, extra={"term": term, "page": page, "error": str(e)})
+        return [SEARCH_SCHEMA.blank(statuscode=failure_status(e), error_message=str(e), search_term=term, page=page,
+                                    timestamp=datetime.datetime.now().isoformat())], None, False
     except Exception as e:
-        print(f"Unexpected error processing term '{term}': {e}")
-        return []
+        log.error("Unexpected error processing term '%s' on page %s: %s", term, page, e, exc_info=True)
+        return [], None, False
+
+# Reorder buffer for one term: pages finish in any order but are released in page order, so ranks
+# come from the real sizes of the earlier pages. A failed page counts as the largest page seen so far;
+# when it fails before any page succeeded its size is unknown and the term's later rows get no rank.
+# An empty page marks the end of the results and everything after it is dropped.
+class TermPages:
+    def __init__(self, term, max_pages):
+        self.term = term
+        self.next_page = 1
+        self.offset = 0
+        self.page_size = 0  # Largest page seen, used to step over pages that failed
+        self.stop_page = max_pages + 1  # First page that will not be released
+        self.buffered = {}
 
-def run_searches_in_threads(workers,root, terms, max_pages,timeout):
+    # rows=None marks a page restored from the journal: it only contributes its size to the ranks
+    def add(self, page, rows, count, ok):
+        if page >= self.stop_page:
+            return
+        if ok and count == 0:
+            self.stop_page = page
+        self.buffered[page] = (rows, count, ok)
+
+    # Release the contiguous run of finished pages as (page, rows, ok)
+    def ready(self):
+        while self.next_page < self.stop_page and self.next_page in self.buffered:
+            page = self.next_page
+            rows, count, ok = self.buffered.pop(page)
+            if ok:
+                for row in rows or []:
+                    row["rank"] = None if self.offset is None else row["rank"] + self.offset
+                if self.offset is not None:
+                    self.offset += count
+                self.page_size = max(self.page_size, count)
+            elif self.page_size:
+                if self.offset is not None:
+                    self.offset += self.page_size
+            else:
+                self.offset = None  # A failed page of unknown size: later ranks cannot be told
+            self.next_page += 1
+            yield page, rows, ok
+
+    @property
+    def done(self):
+        return self.next_page >= self.stop_page
+
+# Sequential walk over one term's pages, stopping at the first empty page
+def get_search_data(root, term, max_pages,timeout,client=None):
+    log.debug("Processing term: %s", term, extra={"term": term})
+    term_pages = TermPages(term, max_pages)
     extracted_data = []
+    for page in range(1, max_pages + 1):
+        if page >= term_pages.stop_page:
+            break
+        term_pages.add(page, *get_search_page(root, term, page, timeout, client))
+        for _, page_rows, _ in term_pages.ready():
+            extracted_data.extend(page_rows)
+    return extracted_data
+
+# Worker side of the scheduler: pages past a known end of results are skipped without a request
+def fetch_search_page(root, term, page, timeout, client, term_pages):
+    if page >= term_pages.stop_page:
+        return None
+    return get_search_page(root, term, page, timeout, client)
+
+# Page cancelled when the run deadline passed
+def timed_out_page(term, page):
+    return [SEARCH_SCHEMA.blank(statuscode=TIMED_OUT, error_message=str(RUN_DEADLINE.exceeded()), search_term=term, page=page,
+                                timestamp=datetime.datetime.now().isoformat())], None, False
+
+# Every (term, page) is an independent unit on the pool. Rows are streamed to the writer (and the
+# journal) in page order per term; returns the number of rows written. progress counts finished terms,
+# failed when any of their pages failed.
+def run_searches_in_threads(workers,root, terms, max_pages,timeout,writer,journal=None,completed=None,progress=None):
+    rows = 0
+    client = get_client(workers)
+    pages = {term: TermPages(term, max_pages) for term in terms}
+    for (term, page), count in (completed or {}).items():
+        if term in pages:
+            pages[term].add(page, None, count, True)
+    failed_terms = set()
+    finished_terms = set()
+    for term, term_pages in pages.items():
+        list(term_pages.ready())
+        if term_pages.done:
+            finished_terms.add(term)
+            if progress is not None:
+                progress.advance()
+
     with ThreadPoolExecutor(max_workers=workers) as executor:  # Using 3 worker threads
-        futures = {executor.submit(get_search_data, root, term, max_pages,timeout): term for term in terms}
-        
-        for future in futures:
-            term = futures[future]
+        futures = {}
+        page_futures = {term: {} for term in terms}
+        # Page-major order: every term's page 1 is queued before any page 2, so an empty page is
+        # usually known before the pages after it start
+        for page in range(1, max_pages + 1):
+            for term in terms:
+                if page < pages[term].stop_page and page not in pages[term].buffered and page >= pages[term].next_page:
+                    future = executor.submit(fetch_search_page, root, term, page, timeout, client, pages[term])
+                    futures[future] = (term, page)
+                    page_futures[term][page] = future
+
+        # Rows of a finished page go out in page order per term, with the journal and progress updated
+        def handle(term, page, result):
+            nonlocal rows
+            term_pages = pages[term]
+            stop_page = term_pages.stop_page
+            term_pages.add(page, *result)
+            if term_pages.stop_page < stop_page:
+                log.debug("%s - no results on page %s, skipping later pages", term, page, extra={"term": term, "page": page})
+                if journal is not None:
+                    journal.record("search", [term, page], [], ok=True)
+                for later_page, later_future in page_futures[term].items():
+                    if later_page > page:
+                        later_future.cancel()
+
+            for ready_page, page_rows, ok in term_pages.ready():
+                if page_rows is None:
+                    continue
+                if journal is not None:
+                    journal.record("search", [term, ready_page], page_rows, ok=ok)
+                writer.extend(page_rows)
+                rows += len(page_rows)
+                if not ok:
+                    failed_terms.add(term)
+            # Pages fetched before the end of results was known can finish after the term is done
+            if term_pages.done and term not in finished_terms:
+                finished_terms.add(term)
+                if progress is not None:
+                    progress.advance(failed=term in failed_terms)
+
+        def time_out_page(future):
+            term, page = futures[future]
+            handle(term, page, timed_out_page(term, page))
+
+        for future in as_completed_by_deadline(futures, time_out_page):
+            term, page = futures[future]
+            if future.cancelled():
+                continue
             try:
                 result = future.result()
-                extracted_data.extend(result)
             except Exception as e:
-                print(f"Error processing term '{term}': {e}")
-    
-    return extracted_data
-
-def write_data_to_excel(output_file, data_list):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Search Data"
+                log.error("Error processing term '%s' page %s: %s", term, page, e, exc_info=True)
+                continue
+            if result is not None:
+                handle(term, page, result)
     
-    headers = [
-        "statuscode"," error_message","search_term", "page", "rank", "title", "brand", "price", "url", "sku","duplicate_sku", "rootdomain", "average_customer_review",
-        "number_of_customer_reviews", "number_of_customer_ratings", "mpn", "is_sponsored", "promo_text", "shipping_type", "get_it_by",
-        "number_of_favorites", "list_price", "open_box_price", "bestseller_text", "quantity_sold", 
-        "description", "image_url", "upc", "seller_id", "timestamp"
-    ]
-    ws.append(headers)
-
-    sku_column_idx = headers.index("sku") + 1  # SKU column index (1-based)
-    duplicate_sku_idx = headers.index("duplicate_sku") + 1  # New duplicate column index
-    
-    sku_counts = {}
+    client.log_concurrency()
+    return rows
 
-    
-    # for data in data_list:
-    #     ws.append([data.get(field, "") for field in headers])
-    
-    for data in data_list:
-        row = []
-        for field in headers:
-            value = data.get(field, "")
+HEADERS = SEARCH_SCHEMA.columns
 
-            # Convert lists or dictionaries to strings
-            if isinstance(value, (list, dict)):
-                value = str(value)
+# Sets duplicate_sku on each row: "True" when the SKU was already written earlier in the output
+def mark_duplicate_skus():
+    seen_skus = set()
 
-            row.append(value)
-        ws.append(row)
+    def prepare(data):
+        sku_value = str(data.get("sku", "") or "").strip()
+        if sku_value:
+            data["duplicate_sku"] = "True" if sku_value in seen_skus else "False"
+            seen_skus.add(sku_value)
 
-    # Save before applying styles to avoid memory issues
-    wb.save(output_file)
+    return prepare
 
-     # Track SKUs for duplicate marking
-    sku_value = str(data.get("sku", "")).strip()
-    if sku_value:
-        sku_counts[sku_value] = sku_counts.get(sku_value, []) + [ws.max_row]
+# Per-row highlighting; a SKU already written earlier in the sheet is marked as a duplicate
+def search_row_fills():
+    duplicate_sku_idx = HEADERS.index("duplicate_sku")
+    mark_duplicate = mark_duplicate_skus()
 
-    # ✅ Second pass: Mark duplicate SKUs
-    for sku, rows in sku_counts.items():
-        is_duplicate = len(rows) > 1  # If SKU appears more than once
-        for row_idx in rows:
-            ws.cell(row=row_idx, column=duplicate_sku_idx, value="True" if is_duplicate else "False")
+    def row_fills(data, values):
+        mark_duplicate(data)
+        values[duplicate_sku_idx] = data.get("duplicate_sku", "")
 
-    # ✅ Apply highlighting (Red for duplicates)
-    red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-    for row_idx in range(2, ws.max_row + 1):
-        cell = ws.cell(row=row_idx, column=duplicate_sku_idx)
-        if cell.value == "True":  # Highlight only True values
-            cell.fill = red_fill
+        fills = {}
+        # Red for duplicates
+        if values[duplicate_sku_idx] == "True":
+            fills["duplicate_sku"] = red_fill
+        # Highlight blank cells (Yellow)
+        for header, value in zip(HEADERS, values):
+            if value in [None, "" , False,"False",0,"0","Unknown","unknown"]:
+                fills[header] = highlight_fill
+        for img_col in ["url","image_url"]:
+            value = values[HEADERS.index(img_col)]
+            if value and not str(value).startswith("http"):  # Check if URL is invalid
+                fills[img_col] = highlight_fill
+        value = values[HEADERS.index("statuscode")]
+        if value and not str(value).startswith("200"):
+            fills["statuscode"] = red_fill
+        return fills
 
+    return row_fills
 
-    highlight_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-    red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
+# Streaming writer for search rows; columns where all values are the same get a red header
+def open_excel_writer(output_file):
+    return StreamingExcelWriter(output_file, HEADERS, "Search Data", row_fills=search_row_fills())
 
-    # Highlight columns where all values are the same (Red)
-    for col_idx, header in enumerate(headers, start=1):
-        column_values = [ws.cell(row=row_idx, column=col_idx).value for row_idx in range(2, ws.max_row + 1)]
+# Search rows in the chosen output format; with another format the highlighted workbook is an optional sample report
+def open_output(output_file, output_format="xlsx", report_rows=0):
+    return open_output_writer(output_file, HEADERS, open_excel_writer, output_format, report_rows, prepare=mark_duplicate_skus())
 
-        # Remove None and empty strings
-        non_empty_values = [val for val in column_values if val not in [None, ""]]
+def write_data_to_excel(output_file, data_list):
+    writer = open_excel_writer(output_file)
+    writer.extend(data_list)
+    writer.close()
+    log.info(f"Data saved to {output_file}")
 
-        if len(set(non_empty_values)) == 1 and len(non_empty_values) > 0:
-            ws.cell(row=1, column=col_idx).fill = red_fill  # Highlight header in red
-        else:
-            continue
-
-    # Highlight blank cells (Yellow)
-    for col_idx, header in enumerate(headers, start=1):
-        is_column_blank = True
-        for row_idx in range(2, ws.max_row + 1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            if cell.value in [None, "" , False,"False",0,"0","Unknown","unknown"]:  # Check if the cell is blank
-                cell.fill = highlight_fill  # Apply yellow fill
-            else:
-                is_column_blank = False
-
-        for row_idx in range(2, ws.max_row + 1):
-            for img_col in ["url","image_url"]:
-                col_idx = headers.index(img_col) + 1  # Find the column index
-                cell = ws.cell(row=row_idx, column=col_idx)
-                if cell.value and not str(cell.value).startswith("http"):  # Check if URL is invalid
-                    cell.fill = highlight_fill
-          
-            for img_col in ["statuscode"]:
-                col_idx = headers.index(img_col) + 1  # Find the column index
-                cell = ws.cell(row=row_idx, column=col_idx)
-                if cell.value and not str(cell.value).startswith("200"):  # Check if URL is invalid
-                    cell.fill = red_fill  
-    # # Highlight duplicate SKUs in red
-    # for sku, rows in sku_counts.items():
-    #     if len(rows) > 1:  # If SKU appears more than once
-    #         for row_idx in rows:
-    #             ws.cell(row=row_idx, column=sku_column_idx).fill = red_fill
-
-    #     # If entire column is blank, highlight the header as well
-    #     if is_column_blank:
-    #         ws.cell(row=1, column=col_idx).fill = highlight_fill
-
-    # Save the workbook after applying styles
-    wb.save(output_file)
-    print(f"Data saved to {output_file}")
-
-def main(workers,root, terms, max_pages,timeout):
+# With resume=True, (term, page) results already in the run journal are restored instead of fetched again.
+# cache is an optional Response_Cache.ResponseCache shared by repeated runs.
+# output_format picks xlsx, csv, jsonl or parquet; report_rows adds a highlighted workbook of the first rows.
+def main(workers,root, terms, max_pages,timeout,resume=False,cache=None,output_format="xlsx",report_rows=0):
     output_file = fr"Search_{root.replace('.','_').replace('/','_')}.xlsx"
-    search_data = run_searches_in_threads(workers,root, terms, max_pages,timeout)
-    if search_data:
-        write_data_to_excel(output_file, search_data)
+    client = get_client(workers, cache)
+    client.new_run()
+    writer = open_output(output_file, output_format, report_rows)
+    with RunJournal(journal_path_for(output_file)) as journal:
+        completed = {}
+        if resume:
+            completed = journal.completed("search")
+            restored = journal.replay("search", writer)
+            log.info(f"Resuming: {restored} pages restored from journal")
+        journal.open(resume)
+        with Progress("search terms", len(terms)) as progress:
+            run_searches_in_threads(workers,root, terms, max_pages,timeout,writer,journal,completed,progress)
+    log.info(client.coalescer.summary())
+    if writer.close():
+        log.info(f"Data saved to {writer.output_file}")
     else:
-        print("No data extracted.")
+        log.info("No data extracted.")
+    if RUN_DEADLINE.expired():
+        log.warning(f"{RUN_DEADLINE.exceeded()}: partial output saved")
+    if cache is not None:
+        log.info(cache.summary())
 
 if __name__ == "__main__":
-    timeout=50000
-    workers=10
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="skip pages already in the run journal and rebuild the workbook from it")
+    add_cache_arguments(parser)
+    add_metrics_arguments(parser)
+    add_output_arguments(parser)
+    add_logging_arguments(parser)
+    add_breaker_arguments(parser)
+    add_timeout_arguments(parser)
+    add_hedging_arguments(parser)
+    args = parser.parse_args()
+    configure_breakers(args)
+    configure_hedging(args)
+    timeout=timeouts_from_args(args)  # Connect/read timeouts per attempt and a deadline per request across its retries
+    workers=10  # Ceiling; the adaptive limiter picks how many requests are in flight
     root =  "hp.com/au"
     terms = ["laptop", "printers", "headphone", "camera", "usb", "monitor", "vr", "keyboard", "mouse", "charger"]   # Add multiple terms here 
     max_pages = 4  # Number of pages per term
-    main(workers,root, terms, max_pages,timeout)
+    with logging_from_args(args), reporter_from_args(args):
+        start_run_deadline(args.deadline)
+        main(workers,root, terms, max_pages,timeout,args.resume,cache_from_args(args),args.format,args.report_rows)